@@ -4,6 +4,7 @@ set "CONVERTER=C:\disk\tools\__misc\
 set "WIN10_SRC=C:\disk\tools\__misc\ʿת\Win10΢ƴʿ.dat"
 REM ֱӰdatԼĿ¼£Եøһ
 
+REM  python main.py --targetsɵ mid\ µļһ main.py
 set "INPUT=.\mid\output_all.txt"
 set "INPUT2=.\mid\output_nodup.txt"
 set "INPUT3=.\mid\output_ms.txt"
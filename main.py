@@ -14,19 +14,44 @@ csv_to_rime_dict.py
 
 from __future__ import annotations
 
+import argparse
 import csv
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import random
+import sqlite3
+import struct
 import sys
-from dataclasses import dataclass
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields, replace
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator, TypeVar
+from urllib.parse import parse_qs, urlparse
 
 try:
-    from pypinyin import lazy_pinyin, pinyin, Style
+    from pypinyin import pinyin, Style
+    from pypinyin.contrib.tone_convert import to_normal, to_tone, to_tone3
+    from pypinyin.phrases_dict import phrases_dict
+    from pypinyin.style import convert as style_convert
 except ImportError:
     print("缺少依赖：pypinyin。请先运行：pip install pypinyin", file=sys.stderr)
     raise
 
 
+T = TypeVar("T")
+
+
 # ================= 配置区（按需修改） =================
 INPUT_CSV = "thd.csv"
 
@@ -44,7 +69,163 @@ OUT_MULTI = "./mid/output_multiaccent.txt"
 OUT_NODUP = "./mid/output_nodup.txt"
 OUT_ACCENT = "./mid/accent.txt"
 
+# 构建输出目录（mid/、mid/shards/ 或 --out-dir）里的内容哈希清单：内容没变的文件不重写（不改 mtime），
+# 下游可按哈希判断要不要重跑。其它输出（release/、--metrics 等指定的路径）只比较内容，不放清单
+OUT_MANIFEST_NAME = "manifest.json"
+
+# 数字读法：按 万/亿 读（10005 -> 一万零五），小数点读作 点；以下情况逐位读（一九九九、零七二一）
+NUMBER_DIGITWISE_YEAR = True            # 紧跟 年 的四位数（1999年）
+NUMBER_DIGITWISE_AFTER_LETTERS = True   # 紧跟英文字母的多位数（STG12 -> STG yi er、TH06）
+NUMBER_DIGITWISE_MIN_LEN = 13           # 这么长的数字（编号、电话号码）；以 0 开头的多位数也总是逐位读
+NUMBER_LIANG = False                    # 千/万/亿 前的 2、量词前单独的 2 读作 两；默认一律读 二
+NUMBER_LIANG_MEASURES = "个只位名次条张本种件头匹把天"
+
+# 多音字展开模式（--multi-expand）：对含多音字的词额外输出其它读音组合
+MULTI_EXPAND = False
+MULTI_EXPAND_MAX = 4          # 每个词最多额外输出几种读音组合
+MULTI_EXPAND_WEIGHT = 1000    # 第一种额外读音的权重（低于 WEIGHT）
+MULTI_EXPAND_WEIGHT_STEP = 100  # 排名每靠后一位，权重再降低多少（最低为 1）
+
+# 模糊音（--fuzzy）：输出 output_fuzzy.txt，收录每个全拼编码的模糊音变体
+OUT_FUZZY = "./mid/output_fuzzy.txt"
+FUZZY_MAX = 8         # 每个词最多输出几种模糊音变体
+FUZZY_WEIGHT = 500
+# 声母模糊规则（双向）
+FUZZY_INITIALS: list[tuple[str, str]] = [
+    ("z", "zh"),
+    ("c", "ch"),
+    ("s", "sh"),
+    ("n", "l"),
+]
+# 韵母模糊规则（双向）；uan/uang 仅对 j/q/x/y 以外的声母生效（juan 里的 u 是 ü）
+FUZZY_FINALS: list[tuple[str, str]] = [
+    ("an", "ang"),
+    ("en", "eng"),
+    ("in", "ing"),
+    ("ian", "iang"),
+    ("uan", "uang"),
+]
+
+# 带声调输出（--tones）：数字声调 / 声调符号 / 注音 各一个文件
+OUT_TONE3 = "./mid/output_tone3.txt"
+OUT_TONEMARK = "./mid/output_tonemark.txt"
+OUT_ZHUYIN = "./mid/output_zhuyin.txt"
+
+# 形码（--shape wubi,cangjie）：需要本地单字编码表，每行“字<Tab>编码”，
+# 也可以直接用 Rime 的 *.dict.yaml（会跳过 "..." 之前的文件头）
+SHAPE_TABLES: dict[str, str] = {
+    "wubi": "./tables/wubi86.dict.yaml",
+    "cangjie": "./tables/cangjie5.dict.yaml",
+}
+OUT_SHAPE = "./mid/output_{}.txt"
+SHAPE_WEIGHT = WEIGHT
+# 组词规则，写法同 Rime 的 encoder formula：
+# 大写字母选字（A B C… 为正数第几个字，Z Y X… 为倒数），小写字母选该字编码的第几码（a b c… / z y x…）
+SHAPE_RULES: dict[str, list[tuple[int, int, str]]] = {
+    "wubi": [
+        (2, 2, "AaAbBaBb"),
+        (3, 3, "AaBaCaCb"),
+        (4, 99, "AaBaCaZa"),
+    ],
+    "cangjie": [
+        (2, 2, "AaAzBaBbBz"),
+        (3, 3, "AaAzBaYzZz"),
+        (4, 99, "AaBzCaYzZz"),
+    ],
+}
+
+# 罗马字（--romaji）：用 thchars.csv 的罗马字（如 Hakurei_Reimu）给角色名加编码
+ROMAJI_CSV = "thchars.csv"
+ROMAJI_NAME_COL = 2      # thchars.csv 中简体名所在列
+ROMAJI_COL = 4           # thchars.csv 中罗马字所在列
+ROMAJI_SKIP_PARTS = {"no"}  # 单独出现没有意义的部分（Huziwara_no_Mokou）
+OUT_ROMAJI = "./mid/output_romaji.txt"
+ROMAJI_WEIGHT = WEIGHT
+
+# 繁体（--trad）：每个词额外输出繁体写法（编码相同）
+# 字表/词表为 OpenCC 格式（STCharacters.txt / STPhrases.txt，每行“简<Tab>繁[ 繁2…]”），放在本地即可；
+# thchars.csv 第 4 列中不含假名的人名也会作为词组使用
+S2T_CHAR_TABLE = "./tables/STCharacters.txt"
+S2T_PHRASE_TABLE = "./tables/STPhrases.txt"
+S2T_THCHARS_COL = 3
+
+# 候选查询索引（--index）：按编码排序的定长偏移数组 + 记录区，查询时 mmap 打开
+OUT_INDEX = "./mid/lookup.idx"
+OUT_EXPLAIN = "./mid/explain.idx"  # --explain：词/编码 -> 来源说明的哈希索引（main.py explain 使用）
+OUT_SQLITE = "./mid/thd.sqlite3"   # --sqlite：可按词、全拼、简拼、分类查询的数据库（含 FTS 子串搜索）
+LOOKUP_LIMIT = 10        # 默认返回几个候选
+LOOKUP_BLOCK = 64        # 索引里每这么多条记录存一个最大权重，前缀查询据此按权重取前 N 个
+LOOKUP_HTTP_HOST = "127.0.0.1"
+
+# 双拼（--shuangpin xiaohe,mspy,...）：每个方案输出一个 output_sp_<方案>.txt
+OUT_SHUANGPIN = "./mid/output_sp_{}.txt"
+SHUANGPIN_WEIGHT = WEIGHT
+
+# 分类词库（--shards）：按 thd.csv 的表头把列分组，每组输出一个 Rime 词库，
+# 再输出一个用 import_tables 引用各组的总词库
+SHARD_DIR = "./mid/shards"
+SHARD_DICT_NAME = "thd"   # 总词库 thd.dict.yaml，分类词库 thd.<分类>.dict.yaml
+SHARD_STATE = "./mid/shards/shards.json"  # 各分类上次构建的内容哈希，没变的分类不重新生成
+# (分类, 表头前缀...)：按顺序匹配，第一个命中的生效；都不命中的列归入 SHARD_DEFAULT
+SHARD_RULES: list[tuple[str, tuple[str, ...]]] = [
+    ("names", ("原作人物名", "姓", "名")),
+    ("works", ("原作名", "原作简称")),
+    ("stg", ("STG", "虹龙洞锦上京")),
+    ("doujin", ("二同", "并非二同")),
+    ("misc", ("神奇小道具", "CP", "场景", "杂项", "种族")),
+    ("spells", ("符卡",)),
+]
+SHARD_DEFAULT = "bgm"     # 其余列是各作品的 BGM 名
+SHARD_DISABLED: set[str] = set()  # 默认不生成的分类，例如 {"spells"}
+
+# 检查（main.py lint）：疑似错字、近似重复、多余空白，按可疑程度排序输出
+OUT_LINT = "./mid/lint.txt"
+LINT_MIN_LEN = 3      # 比较近似重复时忽略更短的词（两字词差一字大多是正常的，如 灵符/梦符）
+LINT_BUCKET_MAX = 12  # 同一位置差一字的词超过这么多个时视为规律（如 XX·上级/XX·中级），不报
+LINT_LIMIT = 50       # 默认在终端显示前几条
+
+# 发布（main.py release）：与上一版的条目快照做有序归并比较，输出增量词库和更新说明
+RELEASE_DIR = "./release"
+RELEASE_SNAPSHOT = "./release/entries.txt"          # 上一版的全部条目（按 文本、编码 排序）
+RELEASE_DELTA_ADD = "./release/thd.delta.add.txt"   # 新增/改权重的条目
+RELEASE_DELTA_REMOVE = "./release/thd.delta.remove.txt"
+RELEASE_CHANGELOG = "./release/changelog.txt"
+RELEASE_CHANGELOG_MAX = 20  # 更新说明里每类最多列出几个词
+
+# 语料权重（--corpus 目录或文件）：统计每个词在本地语料里出现的次数，按档位换算成权重
+CORPUS_GLOB = "*.txt"        # 给目录时读取其中（递归）匹配的文件
+CORPUS_ENCODING = "utf-8"
+CORPUS_CHUNK = 8 << 20       # 大文件按这么大（字节）切块并行扫描
+# (最少出现次数, 权重)，从高到低匹配；一次都没出现的词仍用 WEIGHT
+CORPUS_TIERS: list[tuple[int, int]] = [
+    (1000, 8000),
+    (100, 6000),
+    (10, 4500),
+    (1, 3500),
+]
+
+# 多音字消歧（main.py polyphone 训练，--polyphone-model 使用）：
+# 从带注音的语料（每行 “词或句<Tab>空格分隔的拼音”，如 Rime 词库）学习“邻字 -> 读音”
+POLYPHONE_MODEL = "./mid/polyphone.json"
+OUT_POLYPHONE_SUGGEST = "./mid/polyphone_suggest.txt"
+POLYPHONE_MIN_COUNT = 3    # 一个上下文至少出现这么多次才采用
+POLYPHONE_MIN_CONF = 0.8   # 加一平滑后最多的读音占比低于此值的上下文不采用
+POLYPHONE_LIMIT = 50       # 默认在终端显示前几条建议
+
+# 进度（--progress）：各阶段的处理量、速度、缓存命中率和剩余时间，限频输出到 stderr
+PROGRESS_INTERVAL = 1.0   # 两次报告之间至少隔多少秒
+PROGRESS_SAMPLE = 4096    # 每处理这么多项才看一次时钟（计数本身只是加法）
+OUT_METRICS = "./mid/metrics.prom"  # --metrics：Prometheus 文本格式，供 node_exporter 的 textfile 收集
+
+# 监视模式（--watch）：输入文件一改就重新构建，只重写内容有变化的输出
+WATCH_INTERVAL = 0.5  # 检查文件修改时间的间隔（秒）
+
+# xlsx 工作簿（--xlsx spells.xlsx）：每个工作表的列追加在 thd.csv 的列后面一起构建
+XLSX_CACHE_DIR = "./mid/.cache"        # 解析结果按文件哈希缓存，工作簿没改就不重新解析
+XLSX_SKIP_HEADERS = {"不入列"}         # 这些表头的列不进词库
+
 # 单字自定义读音（最高优先级之一）
+# 可以带声调（"zhuan4" 或 "zhuàn"）；不带时 --tones 借用 pypinyin 里同音读音的声调
 CUSTOM_PINYIN: dict[str, str] = {
     "丁": "ding",
     "万": "wan",
@@ -635,7 +816,7 @@ CUSTOM_PINYIN: dict[str, str] = {
 }
 
 # 整词自定义拼音（最高优先级）
-# value 是“空格分隔”的全拼，例如 "le shan"
+# value 是“空格分隔”的全拼，例如 "le shan"；同样可以带声调，例如 "le4 shan1"
 CUSTOM_WORD_PINYIN: dict[str, str] = {
     "西行寺幽幽子": "xi xing si you you zi",
     "二岩猯藏": "er yan tuan zang",
@@ -1099,42 +1280,77 @@ extra = '''
 # =====================================================
 
 
-# ---------- 数字转中文读音（<10000） ----------
-_DIGITS = ["ling", "yi", "er", "san", "si", "wu", "liu", "qi", "ba", "jiu"]
+# ---------- 数字转汉字读法：0–9999 预先算好，万/亿 组合按需缓存 ----------
+_DIGIT_CHARS = "零一二三四五六七八九"
 
-def num_lt_10000_to_pinyin(n: int) -> list[str]:
-    if n < 0 or n >= 10000:
-        raise ValueError("number out of range (<10000 required)")
+def _num_lt_10000_chars(n: int) -> str:
     if n == 0:
-        return ["ling"]
+        return "零"
 
     parts: list[str] = []
-    qian = n // 1000
-    bai = (n // 100) % 10
-    shi = (n // 10) % 10
-    ge = n % 10
+    zero = False  # 前面已有数字、且刚跳过了一串 0：一串 0 只读一个 零，末尾的 0 不读
+    for d, unit in ((n // 1000, "千"), (n // 100 % 10, "百"), (n // 10 % 10, "十"), (n % 10, "")):
+        if not d:
+            zero = bool(parts)
+            continue
+        if zero:
+            parts.append("零")
+            zero = False
+        if unit == "十" and d == 1 and not parts:
+            parts.append("十")  # 十五 而不是 一十五
+        else:
+            parts += [_DIGIT_CHARS[d], unit]
+    return "".join(parts)
 
-    if qian:
-        parts += [_DIGITS[qian], "qian"]
 
-    if bai:
-        parts += [_DIGITS[bai], "bai"]
-    else:
-        if qian and (shi or ge):
-            parts += ["ling"]
+_NUM_TABLE: tuple[str, ...] = tuple(_num_lt_10000_chars(n) for n in range(10000))
 
-    if shi:
-        if not qian and not bai and shi == 1:
-            parts += ["shi"]
-        else:
-            parts += [_DIGITS[shi], "shi"]
-    else:
-        if (qian or bai) and ge:
-            parts += ["ling"]
 
-    if ge:
-        parts += [_DIGITS[ge]]
-    return parts
+def _int_chars(n: int) -> str:
+    """n < 10^12：四位一组，按 亿、万 读；组内不足千位或中间跳过了整组时补 零"""
+    if n < 10000:
+        return _NUM_TABLE[n]
+    yi, rest = divmod(n, 10 ** 8)
+    wan, ge = divmod(rest, 10 ** 4)
+    out = ""
+    skipped = False
+    for g, unit in ((yi, "亿"), (wan, "万"), (ge, "")):
+        if not g:
+            skipped = bool(out)
+            continue
+        if out and (skipped or g < 1000):
+            out += "零"
+        # 不在最前面的 10–19 读 一十X（一万零一十五）
+        out += ("一" if out and 10 <= g < 20 else "") + _NUM_TABLE[g] + unit
+        skipped = False
+    return out
+
+
+@lru_cache(maxsize=4096)
+def number_chars(digits: str, digitwise: bool = False, liang: bool = False, before_measure: bool = False) -> str:
+    """
+    数字段（可带一个小数点，如 "7.5"）-> 汉字读法，如 "10005" -> "一万零五"、"7.5" -> "七点五"。
+
+    digitwise 时整数部分逐位读；以 0 开头的多位数、NUMBER_DIGITWISE_MIN_LEN 位以上的数总是逐位读。
+    liang 时 千/万/亿 前的 二 改读 两；before_measure（后面紧跟量词）时单独的 2 也读 两。
+    """
+    int_part, _, frac = digits.partition(".")
+    if digitwise or len(int_part) >= NUMBER_DIGITWISE_MIN_LEN or (len(int_part) > 1 and int_part[0] == "0"):
+        out = "".join(_DIGIT_CHARS[int(d)] for d in int_part)
+    else:
+        n = int(int_part)
+        out = _int_chars(n)
+        if liang and n == 2 and before_measure and not frac:
+            out = "两"
+        elif liang:
+            # 十二万 的 二 是个位，不改
+            out = "".join(
+                "两" if c == "二" and out[i + 1:i + 2] in ("千", "万", "亿") and out[i - 1:i] != "十" else c
+                for i, c in enumerate(out)
+            )
+    if frac:
+        out += "点" + "".join(_DIGIT_CHARS[int(d)] for d in frac)
+    return out
 
 
 # ---------- 分段：汉字 / 数字 / 英文(ASCII字母连续段) / 其他 ----------
@@ -1160,10 +1376,14 @@ def segment_text(s: str) -> list[Segment]:
                 j += 1
             segs.append(Segment("han", s[i:j]))
             i = j
-        elif ch.isdigit():
+        elif ch.isdecimal():
             j = i + 1
-            while j < len(s) and s[j].isdigit():
+            while j < len(s) and s[j].isdecimal():
                 j += 1
+            if j + 1 < len(s) and s[j] == "." and s[j + 1].isdecimal():  # 小数
+                j += 1
+                while j < len(s) and s[j].isdecimal():
+                    j += 1
             segs.append(Segment("num", s[i:j]))
             i = j
         elif is_ascii_letter(ch):
@@ -1176,7 +1396,7 @@ def segment_text(s: str) -> list[Segment]:
             j = i + 1
             while j < len(s) and (
                 not ("\u4e00" <= s[j] <= "\u9fff")
-                and not s[j].isdigit()
+                and not s[j].isdecimal()
                 and not is_ascii_letter(s[j])
             ):
                 j += 1
@@ -1185,122 +1405,999 @@ def segment_text(s: str) -> list[Segment]:
     return segs
 
 
-# ---------- 多音字统计结构 ----------
-MULTI_CHAR_ALL_READINGS: dict[str, set[str]] = {}
-MULTI_CHAR_READING_COUNTS: dict[str, dict[str, int]] = {}
+def segment_number_chars(segs: list[Segment], i: int) -> str:
+    """第 i 段（数字段）的汉字读法；是否逐位读、2 读不读 两 看前后紧挨着的字"""
+    text = segs[i].text
+    prev = segs[i - 1].text[-1] if i else ""
+    nxt = segs[i + 1].text[0] if i + 1 < len(segs) else ""
+    int_len = len(text.partition(".")[0])
+    digitwise = int_len > 1 and (
+        (NUMBER_DIGITWISE_AFTER_LETTERS and is_ascii_letter(prev))
+        or (NUMBER_DIGITWISE_YEAR and int_len == 4 and nxt == "年")
+    )
+    return number_chars(text, digitwise, NUMBER_LIANG, NUMBER_LIANG and nxt in NUMBER_LIANG_MEASURES)
+
+
+# ---------- 读音记录：每个字只查一次 pypinyin，同时得到所有风格 ----------
+@dataclass(frozen=True)
+class Reading:
+    normal: str   # 无声调：zhong
+    tone3: str    # 数字声调：zhong4（轻声不带数字）
+    tone: str     # 声调符号：zhòng
+    zhuyin: str   # 注音：ㄓㄨㄥˋ
+
+def plain_reading(token: str) -> Reading:
+    """英文等非拼音 token：各风格都原样输出"""
+    return Reading(token, token, token, token)
+
+def reading_from_pinyin(value: str, tone_known: bool = True) -> Reading:
+    """
+    value 可以是 zhong / zhong4 / zhòng。
+    tone_known=False 表示声调未知（而不是轻声），此时注音不带声调符号。
+    """
+    tone3 = to_tone3(value)
+    mark = to_tone(tone3)
+    zhuyin = style_convert(mark, Style.BOPOMOFO, strict=True) or mark
+    if not tone_known:
+        zhuyin = zhuyin.rstrip("˙")
+    return Reading(to_normal(tone3), tone3, mark, zhuyin)
 
-def han_char_all_readings(ch: str) -> list[str]:
-    if ch in CUSTOM_PINYIN:
-        return [CUSTOM_PINYIN[ch]]
+@lru_cache(maxsize=None)
+def has_tone(value: str) -> bool:
+    return to_tone3(value) != to_normal(value)
 
-    pys = pinyin(ch, style=Style.NORMAL, heteronym=True, errors=lambda _: [])
+@lru_cache(maxsize=None)
+def pypinyin_char_readings(ch: str) -> tuple[Reading, ...]:
+    """pypinyin 给出的全部读音（默认读音在前，按数字声调去重）"""
+    pys = pinyin(ch, style=Style.TONE, heteronym=True, errors=lambda _: [])
     if not pys or not pys[0]:
-        return []
+        return ()
     seen = set()
     out = []
     for x in pys[0]:
-        if x not in seen:
-            seen.add(x)
-            out.append(x)
+        r = reading_from_pinyin(x)
+        if r.tone3 not in seen:
+            seen.add(r.tone3)
+            out.append(r)
+    return tuple(out)
+
+@lru_cache(maxsize=1)
+def phrase_reading_counts() -> dict[str, dict[str, int]]:
+    """pypinyin 词组表中各字每个读音（无声调）出现在多少个词里；多音字展开时用作非默认读音的依据"""
+    counts: dict[str, dict[str, int]] = {}
+    for word, pys in phrases_dict.items():
+        if len(word) != len(pys):
+            continue
+        for ch, py in zip(word, pys):
+            if py:
+                per = counts.setdefault(ch, {})
+                r = to_normal(py[0])
+                per[r] = per.get(r, 0) + 1
+    return counts
+
+@lru_cache(maxsize=None)
+def match_reading(ch: str | None, token: str) -> Reading:
+    """
+    为一个全拼 token 找到对应的读音记录：
+    自带声调则直接使用；否则在该字的 pypinyin 读音里找无声调形式相同的那个（借用声调）；
+    都找不到时声调视为未知。
+    """
+    if has_tone(token):
+        return reading_from_pinyin(token)
+    if ch is not None:
+        for r in pypinyin_char_readings(ch):
+            if r.normal == token:
+                return r
+    if split_syllable(token) is None:
+        return plain_reading(token)
+    return reading_from_pinyin(token, tone_known=False)
+
+
+# ---------- 多音字统计结构（每次构建一份） ----------
+@dataclass
+class MultiCharStats:
+    all_readings: dict[str, set[str]] = field(default_factory=dict)
+    reading_counts: dict[str, dict[str, int]] = field(default_factory=dict)
+
+    def record(self, ch: str, all_readings: list[str], default_reading: str | None) -> None:
+        if len(all_readings) <= 1:
+            return
+        self.all_readings.setdefault(ch, set()).update(all_readings)
+        if default_reading:
+            per = self.reading_counts.setdefault(ch, {})
+            per[default_reading] = per.get(default_reading, 0) + 1
+
+    def accent_lines(self) -> list[str]:
+        lines: list[str] = []
+        for ch in sorted(self.all_readings.keys()):
+            all_readings = self.all_readings.get(ch, set())
+            counts = self.reading_counts.get(ch, {})
+
+            def key_fn(r: str):
+                return (-counts.get(r, 0), r)
+
+            readings_sorted = sorted(all_readings, key=key_fn)
+            lines.append(ch + " " + " ".join(readings_sorted))
+        return lines
+
+
+# ---------- 多音字消歧：语料里学来的“邻字 -> 读音”模型 ----------
+class PolyphoneModel:
+    """
+    键为 字 + "<" + 左邻字 或 字 + ">" + 右邻字，值为 (读音, 置信度, 出现次数)。
+    只保存出现得够多、读音够一致的上下文；查询一个字最多两次字典查找。
+    """
+
+    def __init__(self, contexts: dict[str, tuple[str, float, int]]):
+        self.contexts = contexts
+
+    def pick(self, ch: str, left: str, right: str) -> tuple[str, float, str] | None:
+        """两边的上下文都命中时取置信度高的；返回 (读音, 置信度, 键)"""
+        best: tuple[str, float, str] | None = None
+        for key in (ch + "<" + left if left else "", ch + ">" + right if right else ""):
+            hit = self.contexts.get(key) if key else None
+            if hit is not None and (best is None or hit[1] > best[1]):
+                best = (hit[0], hit[1], key)
+        return best
+
+    @staticmethod
+    def describe(key: str) -> str:
+        return f"{key[0]} 前接 {key[2]}" if key[1] == "<" else f"{key[0]} 后接 {key[2]}"
+
+    def to_json(self) -> str:
+        return json.dumps({"contexts": self.contexts}, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def load_polyphone_model(path: str | Path) -> PolyphoneModel:
+    return _load_polyphone_model(str(path), file_version(path))
+
+@lru_cache(maxsize=4)
+def _load_polyphone_model(path: str, _version: int) -> PolyphoneModel:
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return PolyphoneModel({k: (v[0], v[1], v[2]) for k, v in data["contexts"].items()})
+
+
+# ---------- 读音解析器：自定义读音表 + 多音字统计，一次构建一个 ----------
+class PinyinResolver:
+    """
+    把文本解析成读音记录。自定义读音表和多音字统计都挂在实例上，互不影响，
+    可以在多个线程里各用各的；pypinyin 的查询结果缓存在模块级（只读），所有实例共享。
+
+    stats 为 None 时不做多音字统计（不需要 accent/multiaccent 时省掉这部分开销）。
+    memo 为 dict 时缓存整段文本的解析结果，供 --watch 的多次构建复用。
+    model 为 PolyphoneModel 时，多音字按相邻的字改用语料里学到的读音（自定义读音仍然优先）。
+    """
+
+    def __init__(
+        self,
+        custom_pinyin: dict[str, str] | None = None,
+        custom_word_pinyin: dict[str, str] | None = None,
+        stats: MultiCharStats | None = None,
+        memo: dict | None = None,
+        model: PolyphoneModel | None = None,
+    ):
+        self.custom_pinyin = CUSTOM_PINYIN if custom_pinyin is None else custom_pinyin
+        self.custom_word_pinyin = CUSTOM_WORD_PINYIN if custom_word_pinyin is None else custom_word_pinyin
+        self.stats = stats
+        self.memo = memo  # 文本 -> 解析结果；只能在自定义读音表、模型都相同的解析器之间共用
+        self.model = model
+
+    # ----- 单字 -----
+    def char_readings(self, ch: str) -> tuple[Reading, ...]:
+        """单字的全部读音记录（默认读音在前）；自定义读音命中时只有这一条"""
+        custom = self.custom_pinyin.get(ch)
+        if custom is not None:
+            return (match_reading(ch, custom),)
+        return pypinyin_char_readings(ch)
+
+    def all_readings(self, ch: str) -> list[str]:
+        return dedupe_keep_order(r.normal for r in self.char_readings(ch))
+
+    def default_reading(self, ch: str) -> str | None:
+        records = self.char_readings(ch)
+        return records[0].normal if records else None
+
+    def model_pick(self, text: str, i: int) -> tuple[str, float, str] | None:
+        """模型给 text[i] 选的读音（与默认读音不同时才返回），见 PolyphoneModel.pick"""
+        ch = text[i]
+        if self.model is None or ch in self.custom_pinyin:
+            return None
+        pick = self.model.pick(ch, text[i - 1] if i else "", text[i + 1] if i + 1 < len(text) else "")
+        if pick is None or pick[0] == self.default_reading(ch) or pick[0] not in self.all_readings(ch):
+            return None
+        return pick
+
+    def han_readings(self, text: str) -> tuple[list[Reading], list[tuple[str, list[str], str]], bool]:
+        """返回 (读音记录, 遇到的多音字 [(字, 全部读音, 默认读音)], 是否有无法解析的字)"""
+        readings: list[Reading] = []
+        multi_chars: list[tuple[str, list[str], str]] = []
+        has_unparsed = False
+
+        for i, ch in enumerate(text):
+            if not is_han_char(ch):
+                continue
+
+            records = self.char_readings(ch)
+            if ch in self.custom_pinyin:
+                readings.append(records[0])
+                continue
+
+            if not records:
+                has_unparsed = True
+                continue
+
+            all_readings = self.all_readings(ch)
+            chosen = records[0]
+            if len(all_readings) > 1:
+                pick = self.model_pick(text, i)
+                if pick is not None:
+                    chosen = next(r for r in records if r.normal == pick[0])
+                multi_chars.append((ch, all_readings, chosen.normal))
+
+            readings.append(chosen)
+
+        return readings, multi_chars, has_unparsed
+
+    def num_readings(self, chars: str) -> list[Reading]:
+        """数字的汉字读法（见 number_chars）逐字取默认读音"""
+        return [self.char_readings(ch)[0] for ch in chars]
+
+    # ----- 整词自定义拼音 -----
+    def custom_word_tokens(self, source_text: str) -> list[str] | None:
+        if source_text not in self.custom_word_pinyin:
+            return None
+        val = self.custom_word_pinyin[source_text].strip()
+        if not val:
+            return []
+        return [x for x in val.split() if x]
+
+    def custom_word_readings(self, source_text: str) -> list[Reading] | None:
+        """
+        整词自定义拼音命中时的读音记录。token 可以自带声调（如 "zhuan4"），
+        不带声调时按位置借用对应汉字的声调；无声调 token 的 normal 保持原样。
+        """
+        tokens = self.custom_word_tokens(source_text)
+        if tokens is None:
+            return None
+        chars = source_chars_for_tokens(source_text)
+        if len(chars) != len(tokens):
+            chars = [None] * len(tokens)
+        out = []
+        for tok, ch in zip(tokens, chars):
+            r = match_reading(ch, tok)
+            if not has_tone(tok) and r.normal != tok:
+                r = Reading(tok, r.tone3, r.tone, r.zhuyin)
+            out.append(r)
+        return out
+
+    # ----- 整段文本（英文统一转大写，但不影响整词自定义拼音） -----
+    def readings_for_text(self, source_text: str) -> tuple[list[Reading], bool, bool]:
+        """
+        返回 (readings, has_multiaccent, has_unparsed_non_english)
+
+        优先级：
+        1) 整词自定义拼音：命中则 tokens 完全原样使用，不做英文大写处理
+        2) 正常分段：汉/数/英/其他（英文字段强制转大写）
+
+        设置了 memo 时同一文本只解析一次（--watch 下跨多次构建复用），多音字统计照常按次数记录。
+        """
+        hit = self.memo.get(source_text) if self.memo is not None else None
+        if hit is None:
+            hit = self._resolve_text(source_text)
+            if self.memo is not None:
+                self.memo[source_text] = hit
+        readings, multi_chars, has_unparsed = hit
+        if self.stats is not None:
+            for ch, all_readings, default in multi_chars:
+                self.stats.record(ch, all_readings, default)
+        return list(readings), bool(multi_chars), has_unparsed
+
+    def _resolve_text(self, source_text: str) -> tuple[tuple[Reading, ...], tuple[tuple[str, list[str], str], ...], bool]:
+        custom = self.custom_word_readings(source_text)
+        if custom is not None:
+            return tuple(custom), (), False
+
+        readings: list[Reading] = []
+        multi_chars: list[tuple[str, list[str], str]] = []
+        has_unparsed_non_english = False
+
+        segs = segment_text(source_text)
+        for i, seg in enumerate(segs):
+            if seg.kind == "han":
+                rds, multi, unparsed = self.han_readings(seg.text)
+                readings.extend(rds)
+                multi_chars.extend(multi)
+                if unparsed:
+                    has_unparsed_non_english = True
+
+            elif seg.kind == "num":
+                readings.extend(self.num_readings(segment_number_chars(segs, i)))
+
+            elif seg.kind == "eng":
+                readings.append(plain_reading(seg.text.upper()))  # 英文统一大写
+
+            else:
+                has_unparsed_non_english = True
+
+        return tuple(readings), tuple(multi_chars), has_unparsed_non_english
+
+    def reading_origin(self, source_text: str) -> int:
+        """读音从哪来：ORIGIN_WORD / ORIGIN_CHAR / ORIGIN_MODEL / ORIGIN_DEFAULT（与 readings_for_text 的优先级一致）"""
+        if source_text in self.custom_word_pinyin:
+            return ORIGIN_WORD
+        if any(ch in self.custom_pinyin for ch in source_text if is_han_char(ch)):
+            return ORIGIN_CHAR
+        if self.model_picks(source_text):
+            return ORIGIN_MODEL
+        return ORIGIN_DEFAULT
+
+    def model_picks(self, source_text: str) -> list[tuple[str, str, float, str]]:
+        """整段文本里模型改了读音的字：[(字, 读音, 置信度, 上下文键)]"""
+        if self.model is None or source_text in self.custom_word_pinyin:
+            return []
+        out = []
+        for seg in segment_text(source_text):
+            if seg.kind == "han":
+                for i, ch in enumerate(seg.text):
+                    pick = self.model_pick(seg.text, i)
+                    if pick is not None:
+                        out.append((ch, *pick))
+        return out
+
+    def tokens_for_text(self, source_text: str) -> tuple[list[str], bool, bool]:
+        readings, has_multi, has_unparsed = self.readings_for_text(source_text)
+        return [r.normal for r in readings], has_multi, has_unparsed
+
+    # ----- 多音字展开 -----
+    def reading_costs(self, ch: str, readings: list[str]) -> list[tuple[float, str]]:
+        """
+        给单字的各读音打分（越小越优先），按分数升序返回 [(cost, reading), ...]
+
+        依据 = 本次构建的多音字统计（只记默认读音）+ pypinyin 词组表里的出现次数，
+        cost = -log(加一平滑后的频率)。除默认读音外，没有任何依据的读音直接丢掉，
+        免得冷僻读音（如 方 的 pang/wang）和常见的其它读音并列输出。
+        """
+        counts = self.stats.reading_counts.get(ch, {}) if self.stats is not None else {}
+        phrases = phrase_reading_counts().get(ch, {})
+        evidence = {r: counts.get(r, 0) + phrases.get(r, 0) for r in readings}
+        kept = [r for i, r in enumerate(readings) if i == 0 or evidence[r]]
+        total = sum(evidence[r] for r in kept) + len(kept)
+        scored = [(-math.log((evidence[r] + 1) / total), i, r) for i, r in enumerate(kept)]
+        scored.sort()
+        return [(cost, r) for cost, _, r in scored]
+
+    def token_choices(self, source_text: str) -> list[list[tuple[float, str]]] | None:
+        """
+        与 readings_for_text 相同的分段规则，但每个位置返回所有候选读音（已按代价排序）。
+        整词自定义拼音命中或存在无法解析的部分时返回 None（不展开）。
+        """
+        if source_text in self.custom_word_pinyin:
+            return None
+
+        choices: list[list[tuple[float, str]]] = []
+        segs = segment_text(source_text)
+        for i, seg in enumerate(segs):
+            if seg.kind == "han":
+                for ch in seg.text:
+                    if ch in self.custom_pinyin:
+                        choices.append([(0.0, self.char_readings(ch)[0].normal)])
+                        continue
+                    readings = self.all_readings(ch)
+                    if not readings:
+                        return None
+                    choices.append(self.reading_costs(ch, readings))
+            elif seg.kind == "num":
+                choices.extend([(0.0, r.normal)] for r in self.num_readings(segment_number_chars(segs, i)))
+            elif seg.kind == "eng":
+                choices.append([(0.0, seg.text.upper())])
+            else:
+                return None
+        return choices
+
+    def multi_reading_codes(self, source_text: str, default_code: str, limit: int) -> list[str]:
+        """返回除默认读音外、排名前 limit 的其它读音组合（全拼，空格分隔）"""
+        choices = self.token_choices(source_text)
+        if not choices or limit <= 0:
+            return []
+        out: list[str] = []
+        for tokens in iter_reading_combinations(choices):
+            code = " ".join(tokens)
+            if code == default_code:
+                continue
+            out.append(code)
+            if len(out) >= limit:
+                break
+        return out
+
+
+def source_chars_for_tokens(source_text: str) -> list[str | None]:
+    """按正常分段规则，列出每个 token 对应的源字（数字为读法里的字，英文段为 None）"""
+    out: list[str | None] = []
+    segs = segment_text(source_text)
+    for i, seg in enumerate(segs):
+        if seg.kind == "han":
+            out.extend(seg.text)
+        elif seg.kind == "num":
+            out.extend(segment_number_chars(segs, i))
+        elif seg.kind == "eng":
+            out.append(None)
     return out
 
-def han_char_default_reading(ch: str) -> str | None:
-    if ch in CUSTOM_PINYIN:
-        return CUSTOM_PINYIN[ch]
-    lp = lazy_pinyin(ch, errors=lambda _: [])
-    return lp[0] if lp else None
 
-def record_multi_char_usage(ch: str, all_readings: list[str], default_reading: str | None) -> None:
-    if ch in CUSTOM_PINYIN:
-        return
-    if len(all_readings) <= 1:
+# 不做统计的默认解析器，供单独调用下面的函数时使用
+_DEFAULT_RESOLVER = PinyinResolver()
+
+def pinyin_tokens_for_text(source_text: str) -> tuple[list[str], bool, bool]:
+    """返回 (tokens, has_multiaccent, has_unparsed_non_english)，tokens 为无声调全拼"""
+    return _DEFAULT_RESOLVER.tokens_for_text(source_text)
+
+
+# ---------- 多音字展开：惰性枚举读音组合 ----------
+def iter_reading_combinations(choices: list[list[tuple[float, T]]]) -> Iterator[list[T]]:
+    """
+    按总代价从小到大惰性枚举笛卡尔积（best-first + 堆），不会一次性生成全部组合。
+
+    每个组合用“各位置选第几个读音”的下标向量表示；子节点只在最后一个非零位置及其之后
+    递增下标，保证每个向量只会被生成一次。
+    """
+    n = len(choices)
+    if n == 0:
         return
-    MULTI_CHAR_ALL_READINGS.setdefault(ch, set()).update(all_readings)
-    if default_reading:
-        per = MULTI_CHAR_READING_COUNTS.setdefault(ch, {})
-        per[default_reading] = per.get(default_reading, 0) + 1
+    start = (0,) * n
+    heap: list[tuple[float, int, tuple[int, ...]]] = [(sum(c[0][0] for c in choices), 0, start)]
+    while heap:
+        cost, last, idx = heapq.heappop(heap)
+        yield [choices[i][k][1] for i, k in enumerate(idx)]
+        for j in range(last, n):
+            k = idx[j] + 1
+            if k < len(choices[j]):
+                nxt = idx[:j] + (k,) + idx[j + 1:]
+                step = choices[j][k][0] - choices[j][k - 1][0]
+                heapq.heappush(heap, (cost + step, j, nxt))
 
-def han_pinyin_tokens_with_custom(text: str) -> tuple[list[str], bool, bool]:
-    tokens: list[str] = []
-    has_multi = False
-    has_unparsed = False
 
-    for ch in text:
-        if not is_han_char(ch):
-            continue
+def multi_expand_weight(rank: int, base: int = MULTI_EXPAND_WEIGHT) -> int:
+    return max(1, base - rank * MULTI_EXPAND_WEIGHT_STEP)
 
-        if ch in CUSTOM_PINYIN:
-            tokens.append(CUSTOM_PINYIN[ch])
-            continue
 
-        all_readings = han_char_all_readings(ch)
-        if not all_readings:
-            has_unparsed = True
-            continue
+# ---------- 音节驻留：音节字符串 <-> 整数 id ----------
+# 音节表只增不减，id 在整个进程内稳定，多次构建之间共享；写入时加锁以便多线程构建
+_SYLLABLES: list[str] = []
+_SYLLABLE_IDS: dict[str, int] = {}
+_SYLLABLE_LOCK = threading.Lock()
+
+def syllable_id(s: str) -> int:
+    sid = _SYLLABLE_IDS.get(s)
+    if sid is None:
+        with _SYLLABLE_LOCK:
+            sid = _SYLLABLE_IDS.get(s)
+            if sid is None:
+                sid = len(_SYLLABLES)
+                _SYLLABLES.append(s)
+                _SYLLABLE_IDS[s] = sid
+    return sid
+
+def intern_tokens(tokens: Iterable[str]) -> tuple[int, ...]:
+    return tuple(syllable_id(t) for t in tokens)
+
+def ids_to_code(ids: Iterable[int]) -> str:
+    return " ".join(_SYLLABLES[i] for i in ids)
+
+
+# ---------- 音节合法性：普通话音节先驻留，占据 id 0..N-1 ----------
+# 声母: 可以接的韵母（ü 写作 v，与输出一致）；首行为零声母及叹词音节，末行是 pypinyin 里出现的少见音节
+_LEGAL_SYLLABLE_TABLE = """
+: a ai an ang ao e ei en eng er o ou m n ng hm hng ê
+b: a ai an ang ao ei en eng i ian iao ie in ing o u
+p: a ai an ang ao ei en eng i ian iao ie in ing o ou u
+m: a ai an ang ao e ei en eng i ian iao ie in ing iu o ou u
+f: a an ang ei en eng iao o ou u
+d: a ai an ang ao e ei en eng i ia ian iao ie ing iu ong ou u uan ui un uo
+t: a ai an ang ao e ei eng i ian iao ie ing ong ou u uan ui un uo
+n: a ai an ang ao e ei en eng i ian iang iao ie in ing iu ong ou u uan un uo v ve
+l: a ai an ang ao e ei eng i ia ian iang iao ie in ing iu o ong ou u uan un uo v ve
+g: a ai an ang ao e ei en eng ong ou u ua uai uan uang ui un uo
+k: a ai an ang ao e ei en eng ong ou u ua uai uan uang ui un uo
+h: a ai an ang ao e ei en eng ong ou u ua uai uan uang ui un uo
+j: i ia ian iang iao ie in ing iong iu u uan ue un
+q: i ia ian iang iao ie in ing iong iu u uan ue un
+x: i ia ian iang iao ie in ing iong iu u uan ue un
+zh: a ai an ang ao e ei en eng i ong ou u ua uai uan uang ui un uo
+ch: a ai an ang ao e en eng i ong ou u ua uai uan uang ui un uo
+sh: a ai an ang ao e ei en eng i ou u ua uai uan uang ui un uo
+r: an ang ao e en eng i ong ou u ua uan ui un uo
+z: a ai an ang ao e ei en eng i ong ou u uan ui un uo
+c: a ai an ang ao e en eng i ong ou u uan ui un uo
+s: a ai an ang ao e en eng i ong ou u uan ui un uo
+y: a an ang ao e i in ing o ong ou u uan ue un
+w: a ai an ang ei en eng o u
+: biang bong cei din len nia wong
+"""
+
+_LEGAL_SYLLABLE_COUNT = len({
+    syllable_id(ini.strip() + final)
+    for line in _LEGAL_SYLLABLE_TABLE.strip().splitlines()
+    for ini, finals in [line.split(":")]
+    for final in finals.split()
+})
+assert _LEGAL_SYLLABLE_COUNT == len(_SYLLABLES)  # 必须在任何其它音节驻留之前
+
+
+def is_legal_token(token: str) -> bool:
+    """输出里的 token 是否合法：普通话音节，或英文段（全大写）。一次字典查找"""
+    return _SYLLABLE_IDS.get(token, _LEGAL_SYLLABLE_COUNT) < _LEGAL_SYLLABLE_COUNT or (
+        token.isascii() and token.isupper()
+    )
 
-        default = han_char_default_reading(ch)
-        if len(all_readings) > 1:
-            has_multi = True
-            record_multi_char_usage(ch, all_readings, default)
 
-        if default:
-            tokens.append(default)
+def expected_token_count(source_text: str) -> int:
+    """
+    按正常分段规则应有几个 token（汉字、数字按读法、英文段各算）；
+    分段规则读不了的字（扩展区汉字、假名等）也按一字一音计，它们只能靠整词自定义注音。
+    """
+    n = 0
+    segs = segment_text(source_text)
+    for i, seg in enumerate(segs):
+        if seg.kind == "han":
+            n += len(seg.text)
+        elif seg.kind == "num":
+            n += len(segment_number_chars(segs, i))
+        elif seg.kind == "eng":
+            n += 1
         else:
-            has_unparsed = True
+            n += sum(ch.isalpha() for ch in seg.text)
+    return n
+
+
+def check_overrides(custom_pinyin: dict[str, str], custom_word_pinyin: dict[str, str]) -> list[str]:
+    """检查自定义读音表：不合法的音节、音节数与字数不符、永远用不到的键"""
+    problems: list[str] = []
+    for ch, value in custom_pinyin.items():
+        tokens = value.split()
+        if len(tokens) != 1:
+            problems.append(f'CUSTOM_PINYIN["{ch}"] = "{value}"：应当正好一个音节')
+        elif not is_legal_token(match_reading(ch, tokens[0]).normal):
+            problems.append(f'CUSTOM_PINYIN["{ch}"] = "{value}"：不合法的音节')
+    for text, value in custom_word_pinyin.items():
+        tokens = value.split()
+        if not tokens:
+            continue  # 空值表示不输出这个词
+        where = f'CUSTOM_WORD_PINYIN["{text}"] = "{value}"'
+        if NAME_SEPARATOR in text:
+            problems.append(f"{where}：人名按 {NAME_SEPARATOR} 拆开后分别查找，带 {NAME_SEPARATOR} 的键用不到")
+            continue
+        bad = [t for t in tokens if not is_legal_token(match_reading(None, t).normal)]
+        if bad:
+            problems.append(f"{where}：不合法的音节 {' '.join(bad)}")
+        n = expected_token_count(text)
+        if n != len(tokens):
+            problems.append(f"{where}：{len(tokens)} 个音节，但文本应有 {n} 个")
+    return problems
 
-    return tokens, has_multi, has_unparsed
 
+_INITIALS = (
+    "zh", "ch", "sh",
+    "b", "p", "m", "f", "d", "t", "n", "l", "g", "k", "h",
+    "j", "q", "x", "r", "z", "c", "s", "y", "w",
+)
 
-# ---------- 整词自定义拼音 ----------
-def tokens_from_custom_word_pinyin(source_text: str) -> list[str] | None:
-    if source_text not in CUSTOM_WORD_PINYIN:
+def split_syllable(s: str) -> tuple[str, str] | None:
+    """把小写全拼音节拆成 (声母, 韵母)；零声母时声母为空。非拼音（如大写英文）返回 None"""
+    if not s or not s.isascii() or not s.islower() or not s.isalpha():
         return None
-    val = CUSTOM_WORD_PINYIN[source_text].strip()
-    if not val:
+    for ini in _INITIALS:
+        if s.startswith(ini) and len(s) > len(ini):
+            return ini, s[len(ini):]
+    return "", s
+
+
+# ---------- 模糊音：音节级规则表，按音节 id 缓存 ----------
+def _fuzzy_alternatives(value: str, rules: list[tuple[str, str]]) -> list[str]:
+    out = [value]
+    for a, b in rules:
+        if value == a:
+            out.append(b)
+        elif value == b:
+            out.append(a)
+    return out
+
+_FUZZY_VARIANTS: dict[int, tuple[tuple[float, int], ...]] = {}
+
+def fuzzy_variants(sid: int) -> tuple[tuple[float, int], ...]:
+    """
+    音节 id 的模糊音变体（不含自身、只保留合法音节），返回 ((改动处数, 变体 id), ...)，按改动处数升序。
+    每个音节只计算一次。
+    """
+    cached = _FUZZY_VARIANTS.get(sid)
+    if cached is not None:
+        return cached
+
+    out: list[tuple[float, int]] = []
+    parts = split_syllable(_SYLLABLES[sid])
+    if parts is not None:
+        ini, fin = parts
+        finals = _fuzzy_alternatives(fin, FUZZY_FINALS)
+        if ini in ("j", "q", "x", "y"):
+            finals = [f for f in finals if f == fin or not f.startswith("uan")]
+        for i in _fuzzy_alternatives(ini, FUZZY_INITIALS):
+            for f in finals:
+                changes = (i != ini) + (f != fin)
+                if changes and is_legal_token(i + f):  # diang、miang 这类不存在的音节不占名额
+                    out.append((float(changes), syllable_id(i + f)))
+    out.sort()
+    variants = tuple(out)
+    _FUZZY_VARIANTS[sid] = variants
+    return variants
+
+
+def fuzzy_codes(ids: tuple[int, ...], limit: int) -> list[str]:
+    """
+    返回至多 limit 个模糊音编码：改动处少的优先（复用多音字展开的 best-first 枚举）。
+    """
+    if limit <= 0:
         return []
-    return [x for x in val.split() if x]
+    choices = [[(0.0, sid)] + list(fuzzy_variants(sid)) for sid in ids]
+    out: list[str] = []
+    combos = iter_reading_combinations(choices)
+    next(combos, None)  # 第一个组合就是原编码
+    for combo in combos:
+        out.append(ids_to_code(combo))
+        if len(out) >= limit:
+            break
+    return out
 
 
-# ---------- 生成 tokens（英文统一转大写，但不影响 CUSTOM_WORD_PINYIN） ----------
-def pinyin_tokens_for_text(source_text: str) -> tuple[list[str], bool, bool]:
+# ---------- 双拼：音节 -> 两键 的预计算表 ----------
+@dataclass(frozen=True)
+class ShuangpinScheme:
+    name: str
+    initials: dict[str, str]   # 只需列出 zh/ch/sh，其余声母按原字母
+    finals: dict[str, str]
+    zero: str                  # 零声母规则："double"（aa/ai/ah）或 "o"（oa/ol/oh）
+
+
+_SP_ZCS = {"zh": "v", "ch": "i", "sh": "u"}
+
+SHUANGPIN_SCHEMES: dict[str, ShuangpinScheme] = {
+    "xiaohe": ShuangpinScheme("xiaohe", _SP_ZCS, {
+        "a": "a", "o": "o", "e": "e", "i": "i", "u": "u", "v": "v",
+        "ai": "d", "ei": "w", "ui": "v", "ao": "c", "ou": "z", "iu": "q",
+        "ie": "p", "ue": "t", "ve": "t", "er": "r", "an": "j", "en": "f",
+        "in": "b", "un": "y", "vn": "y", "ang": "h", "eng": "g", "ing": "k",
+        "ong": "s", "ia": "x", "ua": "x", "uo": "o", "uai": "k", "iao": "n",
+        "ian": "m", "iang": "l", "uang": "l", "iong": "s", "uan": "r", "van": "r",
+    }, "double"),
+    "ziranma": ShuangpinScheme("ziranma", _SP_ZCS, {
+        "a": "a", "o": "o", "e": "e", "i": "i", "u": "u", "v": "v",
+        "ai": "l", "ei": "z", "ui": "v", "ao": "k", "ou": "b", "iu": "q",
+        "ie": "x", "ue": "t", "ve": "t", "er": "r", "an": "j", "en": "f",
+        "in": "n", "un": "p", "vn": "p", "ang": "h", "eng": "g", "ing": "y",
+        "ong": "s", "ia": "w", "ua": "w", "uo": "o", "uai": "y", "iao": "c",
+        "ian": "m", "iang": "d", "uang": "d", "iong": "s", "uan": "r", "van": "r",
+    }, "double"),
+    "mspy": ShuangpinScheme("mspy", _SP_ZCS, {
+        "a": "a", "o": "o", "e": "e", "i": "i", "u": "u", "v": "y",
+        "ai": "l", "ei": "z", "ui": "v", "ao": "k", "ou": "b", "iu": "q",
+        "ie": "x", "ue": "t", "ve": "v", "er": "r", "an": "j", "en": "f",
+        "in": "n", "un": "p", "vn": "p", "ang": "h", "eng": "g", "ing": ";",
+        "ong": "s", "ia": "w", "ua": "w", "uo": "o", "uai": "y", "iao": "c",
+        "ian": "m", "iang": "d", "uang": "d", "iong": "s", "uan": "r", "van": "r",
+    }, "o"),
+    "sogou": ShuangpinScheme("sogou", _SP_ZCS, {
+        "a": "a", "o": "o", "e": "e", "i": "i", "u": "u", "v": "y",
+        "ai": "l", "ei": "z", "ui": "v", "ao": "k", "ou": "b", "iu": "q",
+        "ie": "x", "ue": "t", "ve": "t", "er": "r", "an": "j", "en": "f",
+        "in": "n", "un": "p", "vn": "p", "ang": "h", "eng": "g", "ing": ";",
+        "ong": "s", "ia": "w", "ua": "w", "uo": "o", "uai": "y", "iao": "c",
+        "ian": "m", "iang": "d", "uang": "d", "iong": "s", "uan": "r", "van": "r",
+    }, "o"),
+}
+
+
+def shuangpin_code(scheme: ShuangpinScheme, syllable: str) -> str | None:
+    parts = split_syllable(syllable)
+    if parts is None:
+        return None
+    ini, fin = parts
+    if ini:
+        key = scheme.finals.get(fin)
+        if key is None:
+            return None
+        return scheme.initials.get(ini, ini) + key
+    # 零声母
+    if fin not in scheme.finals:
+        return None
+    if scheme.zero == "o":
+        return "o" + scheme.finals[fin]
+    if len(fin) == 1:
+        return fin + fin
+    if len(fin) == 2:
+        return fin
+    return fin[0] + scheme.finals[fin]
+
+
+def shuangpin_table(scheme: ShuangpinScheme) -> list[str]:
+    """按音节 id 下标的双拼表；无法转换的音节（英文等）保持原样"""
+    table: list[str] = []
+    for s in list(_SYLLABLES):
+        code = shuangpin_code(scheme, s)
+        table.append(code if code is not None else s)
+    return table
+
+
+def parse_shuangpin_schemes(value: str) -> list[str]:
+    names = [x.strip().lower() for x in value.split(",") if x.strip()]
+    if "all" in names:
+        return list(SHUANGPIN_SCHEMES)
+    unknown = [x for x in names if x not in SHUANGPIN_SCHEMES]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"未知的双拼方案：{', '.join(unknown)}（可选：{', '.join(SHUANGPIN_SCHEMES)}, all）"
+        )
+    return dedupe_keep_order(names)
+
+
+# ---------- 形码：数组存储的单字编码表 + 组词规则 ----------
+_CJK_BASE = 0x4E00
+_CJK_SIZE = 0xA000 - 0x4E00
+
+
+class CharCodeTable:
+    """
+    单字 -> 编码 的紧凑查找表。
+    基本区汉字用 offsets(array('I')) + 一整块 ASCII 编码池按码位直接下标，其余字放进小 dict。
+    """
+
+    def __init__(self, codes: dict[str, str]):
+        pool = bytearray()
+        offsets = array("I", [0]) * (_CJK_SIZE + 1)
+        self.extra: dict[str, str] = {}
+        for cp in range(_CJK_SIZE):
+            offsets[cp] = len(pool)
+            code = codes.get(chr(_CJK_BASE + cp))
+            if code:
+                pool += code.encode("ascii")
+        offsets[_CJK_SIZE] = len(pool)
+        for ch, code in codes.items():
+            if not ("\u4e00" <= ch <= "\u9fff"):
+                self.extra[ch] = code
+        self.pool = bytes(pool)
+        self.offsets = offsets
+
+    def get(self, ch: str) -> str | None:
+        cp = ord(ch) - _CJK_BASE
+        if 0 <= cp < _CJK_SIZE:
+            start, end = self.offsets[cp], self.offsets[cp + 1]
+            return self.pool[start:end].decode("ascii") if end > start else None
+        return self.extra.get(ch)
+
+
+def load_char_code_table(path: str | Path) -> CharCodeTable:
+    """读取“字<Tab>编码”表；同一个字有多个编码时取最长的（全码），等长取先出现的"""
+    return _load_char_code_table(str(path), file_version(path))
+
+@lru_cache(maxsize=8)
+def _load_char_code_table(path: str, _version: int) -> CharCodeTable:
+    codes: dict[str, str] = {}
+    with Path(path).open("r", encoding="utf-8") as f:
+        lines = list(f)
+    if any(line.rstrip() == "..." for line in lines):
+        lines = lines[[line.rstrip() for line in lines].index("...") + 1:]
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split("\t")
+        if len(parts) < 2 or len(parts[0]) != 1:
+            continue
+        ch, code = parts[0], parts[1].strip()
+        if not code.isascii() or not code.isalpha():
+            continue
+        if len(code) > len(codes.get(ch, "")):
+            codes[ch] = code.lower()
+    return CharCodeTable(codes)
+
+
+def _formula_index(letter: str, base: str) -> int:
+    """A/a -> 0, B/b -> 1 … ；Z/z -> -1, Y/y -> -2 …（正数取前 10 个字母）"""
+    k = ord(letter) - ord(base)
+    return k if k < 10 else k - 26
+
+def apply_shape_formula(formula: str, char_codes: list[str]) -> str:
+    out = []
+    for i in range(0, len(formula) - 1, 2):
+        ci = _formula_index(formula[i], "A")
+        ki = _formula_index(formula[i + 1], "a")
+        if not -len(char_codes) <= ci < len(char_codes):
+            continue
+        code = char_codes[ci]
+        if -len(code) <= ki < len(code):
+            out.append(code[ki])
+    return "".join(out)
+
+def shape_word_code(text: str, table: CharCodeTable, rules: list[tuple[int, int, str]]) -> str | None:
+    """按组词规则计算整词编码；有字不在表中（或不是汉字）时返回 None"""
+    char_codes = []
+    for ch in text:
+        code = table.get(ch)
+        if code is None:
+            return None
+        char_codes.append(code)
+    if len(char_codes) == 1:
+        return char_codes[0]
+    for lo, hi, formula in rules:
+        if lo <= len(char_codes) <= hi:
+            return apply_shape_formula(formula, char_codes)
+    return None
+
+
+def parse_shape_schemes(value: str) -> list[str]:
+    names = [x.strip().lower() for x in value.split(",") if x.strip()]
+    unknown = [x for x in names if x not in SHAPE_TABLES]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"未知的形码方案：{', '.join(unknown)}（可选：{', '.join(SHAPE_TABLES)}）"
+        )
+    return dedupe_keep_order(names)
+
+
+# ---------- 罗马字：thchars.csv 与 thd.csv 人物行的哈希连接 ----------
+def load_romaji_map(path: str | Path) -> dict[str, list[str]]:
+    """thchars.csv（小表）建哈希：简体名 -> 罗马字各部分（小写）"""
+    return _load_romaji_map(str(path), file_version(path))
+
+@lru_cache(maxsize=4)
+def _load_romaji_map(path: str, _version: int) -> dict[str, list[str]]:
+    out: dict[str, list[str]] = {}
+    with Path(path).open("r", encoding="utf-8-sig", newline="") as f:
+        for r in csv.reader(f):
+            if len(r) <= max(ROMAJI_NAME_COL, ROMAJI_COL):
+                continue
+            name = r[ROMAJI_NAME_COL].strip()
+            parts = [p.lower() for p in r[ROMAJI_COL].strip().split("_") if p]
+            if name and parts and all(p.isascii() and p.isalpha() for p in parts):
+                out.setdefault(name, parts)
+    return out
+
+
+def romaji_join(rows: Iterable[list[str]], romaji_map: dict[str, list[str]]) -> Iterator[tuple[str, str]]:
     """
-    返回 (tokens, has_multiaccent, has_unparsed_non_english)
+    流式遍历 thd.csv 的行（前三列：全名 / 姓 / 名），在哈希表里查罗马字，产出 (文本, 编码)。
 
-    优先级：
-    1) CUSTOM_WORD_PINYIN：命中则 tokens 完全原样使用，不做英文大写处理
-    2) 正常分段：汉/数/英/其他（英文字段强制转大写）
+    - 全名：每个部分单独一个编码，再加上全部连写（hakurei / reimu / hakureireimu）
+    - 姓、名列：全名以其开头/结尾时分别对应第一/最后一个部分
+    - 带中间点的名字：点分部分与罗马字部分个数相同时一一对应
     """
-    custom = tokens_from_custom_word_pinyin(source_text)
-    if custom is not None:
-        return custom, False, False
+    for r in rows:
+        if not r:
+            continue
+        name = r[0].strip()
+        parts = romaji_map.get(name)
+        if not parts:
+            continue
+        for p in parts:
+            if p not in ROMAJI_SKIP_PARTS:
+                yield name, p
+        if len(parts) > 1:
+            yield name, "".join(parts)
 
-    tokens: list[str] = []
-    has_multiaccent = False
-    has_unparsed_non_english = False
+        if NAME_SEPARATOR in name:
+            name_parts = [x.strip() for x in name.split(NAME_SEPARATOR)]
+            if len(name_parts) == len(parts):
+                for np, p in zip(name_parts, parts):
+                    if np:
+                        yield np, p
+        elif len(parts) > 1:
+            surname = r[1].strip() if len(r) > 1 else ""
+            given = r[2].strip() if len(r) > 2 else ""
+            if surname and name.startswith(surname):
+                yield surname, parts[0]
+            if given and name.endswith(given):
+                yield given, parts[-1]
 
-    for seg in segment_text(source_text):
-        if seg.kind == "han":
-            tks, multi, unparsed = han_pinyin_tokens_with_custom(seg.text)
-            tokens.extend(tks)
-            if multi:
-                has_multiaccent = True
-            if unparsed:
-                has_unparsed_non_english = True
 
-        elif seg.kind == "num":
-            n = int(seg.text)
-            if n >= 10000:
-                has_unparsed_non_english = True
+# ---------- 简转繁：词组最长匹配（字典树）+ 单字表 ----------
+_TRIE_END = ""  # 空串不会和任何单字冲突，用作词尾标记
+
+def is_kana(ch: str) -> bool:
+    return "\u3040" <= ch <= "\u30ff"
+
+
+def load_opencc_table(path: str | Path) -> dict[str, str]:
+    """OpenCC 文本表：每行“源<Tab>目标1 目标2…”，取第一个目标"""
+    out: dict[str, str] = {}
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) >= 2 and parts[0] and parts[1].strip():
+                out.setdefault(parts[0], parts[1].split()[0])
+    return out
+
+
+def load_thchars_trad_phrases(path: str | Path) -> dict[str, str]:
+    """thchars.csv 的人名繁体写法（只收不含假名、去掉中间点后字数一致的）"""
+    out: dict[str, str] = {}
+    with Path(path).open("r", encoding="utf-8-sig", newline="") as f:
+        for r in csv.reader(f):
+            if len(r) <= max(ROMAJI_NAME_COL, S2T_THCHARS_COL):
+                continue
+            simp = r[ROMAJI_NAME_COL].strip()
+            trad = r[S2T_THCHARS_COL].strip().replace("・", NAME_SEPARATOR)
+            if not simp or not trad or simp == trad or any(is_kana(ch) for ch in trad):
+                continue
+            if len(simp) == len(trad):
+                out[simp] = trad
+    return out
+
+
+class S2TConverter:
+    """进程内的简转繁：先按词组字典树做最长匹配，匹配不到的字再查单字表"""
+
+    def __init__(self, phrases: dict[str, str], chars: dict[str, str]):
+        self.root: dict = {}
+        for src, dst in phrases.items():
+            node = self.root
+            for ch in src:
+                node = node.setdefault(ch, {})
+            node[_TRIE_END] = dst
+        self.chars = chars
+
+    def convert(self, text: str) -> str:
+        out: list[str] = []
+        i = 0
+        n = len(text)
+        while i < n:
+            node = self.root
+            j = i
+            best: str | None = None
+            best_end = i
+            while j < n and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if _TRIE_END in node:
+                    best = node[_TRIE_END]
+                    best_end = j
+            if best is not None:
+                out.append(best)
+                i = best_end
             else:
-                tokens.extend(num_lt_10000_to_pinyin(n))
+                out.append(self.chars.get(text[i], text[i]))
+                i += 1
+        return "".join(out)
 
-        elif seg.kind == "eng":
-            tokens.append(seg.text.upper())  # 英文统一大写
 
-        else:
-            has_unparsed_non_english = True
+def file_version(path: str | Path) -> int:
+    """文件的修改时间（纳秒）；不存在时为 -1。用作缓存键，文件改了缓存自然失效"""
+    try:
+        return Path(path).stat().st_mtime_ns
+    except FileNotFoundError:
+        return -1
+
+
+def build_s2t_converter() -> S2TConverter:
+    """同一进程内多次构建共享同一个转换器（相关文件没改时）"""
+    return _build_s2t_converter(
+        file_version(S2T_PHRASE_TABLE), file_version(S2T_CHAR_TABLE), file_version(ROMAJI_CSV)
+    )
 
-    return tokens, has_multiaccent, has_unparsed_non_english
+@lru_cache(maxsize=4)
+def _build_s2t_converter(*_versions: int) -> S2TConverter:
+    tables = [S2T_PHRASE_TABLE, S2T_CHAR_TABLE, ROMAJI_CSV]
+    if not any(Path(p).exists() for p in tables):
+        raise BuildError(f"--trad 需要简繁对照表，一个都找不到：{'、'.join(str(Path(p).resolve()) for p in tables)}")
+    phrases: dict[str, str] = {}
+    chars: dict[str, str] = {}
+    if Path(S2T_PHRASE_TABLE).exists():
+        phrases.update(load_opencc_table(S2T_PHRASE_TABLE))
+    if Path(S2T_CHAR_TABLE).exists():
+        chars = load_opencc_table(S2T_CHAR_TABLE)
+    else:
+        print(f"提示：找不到 {S2T_CHAR_TABLE}，只做整词转换", file=sys.stderr)
+    if Path(ROMAJI_CSV).exists():
+        phrases.update(load_thchars_trad_phrases(ROMAJI_CSV))
+    else:
+        print(f"提示：找不到 {ROMAJI_CSV}，人名不按其中的繁体写法转换", file=sys.stderr)
+    return S2TConverter(phrases, chars)
 
 
 # ---------- 人名中间点展开 ----------
@@ -1330,6 +2427,25 @@ def expand_name_entries(word: str) -> list[tuple[str, str]]:
     return out
 
 
+# expand_name_entries 产出的每一项对应哪条规则（--explain 用）
+NAME_RULES = ("原样", "人名第一部分", "人名最后部分", "全名（按第一部分注音）")
+
+
+def name_rule(word: str, display_text: str) -> int:
+    w = word.strip()
+    if NAME_SEPARATOR not in w:
+        return 0
+    if display_text == w:
+        return 3
+    return 1 if display_text == w.split(NAME_SEPARATOR)[0].strip() else 2
+
+
+def name_rule_source(word: str, rule: int) -> str:
+    """按规则还原注音用的源文本"""
+    parts = [p.strip() for p in word.strip().split(NAME_SEPARATOR)]
+    return parts[-1] if rule == 2 else parts[0]
+
+
 # ---------- 输出格式 ----------
 def format_rime_line(text: str, code: str, weight: int) -> str:
     if weight >= 0:
@@ -1345,72 +2461,1783 @@ def dedupe_keep_order(items: Iterable[str]) -> list[str]:
             out.append(x)
     return out
 
-def accent_lines_sorted() -> list[str]:
-    lines: list[str] = []
-    for ch in sorted(MULTI_CHAR_ALL_READINGS.keys()):
-        if ch in CUSTOM_PINYIN:
-            continue
-        all_readings = MULTI_CHAR_ALL_READINGS.get(ch, set())
-        counts = MULTI_CHAR_READING_COUNTS.get(ch, {})
+# ---------- 候选查询：编码（或前缀）-> 按权重排序的候选 ----------
+_INDEX_MAGIC = b"THDIDX2\0"
+_INDEX_HEADER = struct.Struct("<8sII")
 
-        def key_fn(r: str):
-            return (-counts.get(r, 0), r)
 
-        readings_sorted = sorted(all_readings, key=key_fn)
-        lines.append(ch + " " + " ".join(readings_sorted))
-    return lines
+def lookup_key(code: str) -> str:
+    """查询键：去掉空格、转小写（"ling meng" 与 "lingmeng" 等价）"""
+    return code.replace(" ", "").lower()
 
 
-def main() -> int:
-    in_path = Path(INPUT_CSV)
-    if not in_path.exists():
-        print(f"找不到输入文件：{in_path.resolve()}", file=sys.stderr)
-        return 1
+def parse_dict_line(line: str) -> tuple[str, str, int] | None:
+    parts = line.split(COL_SEP)
+    if len(parts) < 2 or not parts[0] or not parts[1]:
+        return None
+    weight = int(parts[2]) if len(parts) >= 3 and parts[2].strip().isdigit() else 0
+    return parts[0], parts[1], weight
 
-    with in_path.open("r", encoding="utf-8", newline="") as f:
-        reader = csv.reader(f)
-        rows = list(reader)
 
-    if not rows:
-        print("CSV 为空。", file=sys.stderr)
-        return 1
+def candidate_index_bytes(entries: Iterable[tuple[str, str, int]]) -> tuple[bytes, int]:
+    """
+    生成索引文件内容，返回 (内容, 条数)。文件格式（小端）：
+      magic(8) | N(uint32) | B(uint32) | offsets[N+1](uint32) | weights[N](uint32) | block_max[⌈N/B⌉](uint32) | 记录区
+    每条记录为 "键\t文本\t编码"（UTF-8），记录按 (键, -权重, 文本) 排序；
+    block_max[b] 为第 b 组（B = LOOKUP_BLOCK 条）记录的最大权重。
+    """
+    items = sorted(
+        {(lookup_key(code), -weight, text, code) for text, code, weight in entries if code}
+    )
+    blob = bytearray()
+    offsets = array("I")
+    weights = array("I")
+    for key, neg_w, text, code in items:
+        offsets.append(len(blob))
+        weights.append(max(0, -neg_w))
+        blob += f"{key}\t{text}\t{code}".encode("utf-8")
+    offsets.append(len(blob))
+    block_max = array("I", (max(weights[i:i + LOOKUP_BLOCK]) for i in range(0, len(weights), LOOKUP_BLOCK)))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+        weights.byteswap()
+        block_max.byteswap()
+    header = _INDEX_HEADER.pack(_INDEX_MAGIC, len(items), LOOKUP_BLOCK)
+    return header + offsets.tobytes() + weights.tobytes() + block_max.tobytes() + bytes(blob), len(items)
 
-    data_rows = rows[1:]  # 跳过标题
-    max_cols = max((len(r) for r in data_rows), default=0)
-
-    # 按列收集并列内去重
-    cols: list[list[str]] = []
-    for c in range(max_cols):
-        col_items: list[str] = []
-        for r in data_rows:
-            if c < len(r):
-                v = r[c].strip()
-                if v:
-                    col_items.append(v)
-        cols.append(dedupe_keep_order(col_items))
 
-    full_lines: list[str] = []
-    simp_lines: list[str] = []
-    multi_lines: list[str] = []
+def _uint32_view(buf: memoryview) -> memoryview | array:
+    if sys.byteorder == "little":
+        return buf.cast("I")
+    out = array("I", buf.tobytes())
+    out.byteswap()
+    return out
 
-    nodup_words: list[str] = []
+
+class CandidateIndex:
+    """
+    mmap 打开的只读候选索引：启动只需读文件头，查询为几次二分，不解析整个文件。
+    """
+
+    def __init__(self, path: str | Path):
+        try:
+            self._file = Path(path).open("rb")
+        except FileNotFoundError:
+            raise BuildError(f"找不到候选索引：{Path(path).resolve()}（先用 --index 构建）") from None
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, block = _INDEX_HEADER.unpack_from(self._mm, 0)
+        if magic != _INDEX_MAGIC:
+            self.close()
+            raise BuildError(f"不是候选索引文件（或是旧版本生成的，请用 --index 重新构建）：{path}")
+        self.count = n
+        self._block = block
+        view = memoryview(self._mm)
+        off_start = _INDEX_HEADER.size
+        w_start = off_start + 4 * (n + 1)
+        b_start = w_start + 4 * n
+        self._data_start = b_start + 4 * -(-n // block)
+        self._offsets = _uint32_view(view[off_start:w_start])
+        self._weights = _uint32_view(view[w_start:b_start])
+        self._block_max = _uint32_view(view[b_start:self._data_start])
+        view.release()
+
+    def close(self) -> None:
+        for v in (getattr(self, "_offsets", None), getattr(self, "_weights", None), getattr(self, "_block_max", None)):
+            if isinstance(v, memoryview):
+                v.release()
+        self._mm.close()
+        self._file.close()
+
+    def _record(self, i: int) -> tuple[str, str, int]:
+        raw = self._mm[self._data_start + self._offsets[i]:self._data_start + self._offsets[i + 1]]
+        _, text, code = raw.decode("utf-8").split("\t")
+        return text, code, self._weights[i]
+
+    def _key(self, i: int) -> bytes:
+        start = self._data_start + self._offsets[i]
+        end = self._mm.find(b"\t", start, self._data_start + self._offsets[i + 1])
+        return self._mm[start:end]
+
+    def _lower_bound(self, key: bytes, lo: int = 0) -> int:
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, query: str, limit: int = LOOKUP_LIMIT) -> list[tuple[str, str, int]]:
+        """
+        返回 [(文本, 编码, 权重), ...]：完全匹配的编码在前（文件里已按权重排好），
+        不足 limit 个时再从以 query 为前缀的编码里按权重补足（见 _top_by_weight）。
+        三次二分确定区间，排序只读权重数组，最后只解码要返回的那几条记录。
+        """
+        key = lookup_key(query).encode("utf-8")
+        if not key or limit <= 0:
+            return []
+        lo = self._lower_bound(key)
+        exact_hi = self._lower_bound(key + b"\x00", lo)
+        out = [self._record(i) for i in range(lo, min(exact_hi, lo + limit))]
+        if len(out) < limit:
+            hi = self._lower_bound(key + b"\xff", exact_hi)  # UTF-8 中不会出现 0xff
+            out += [self._record(i) for i in self._top_by_weight(exact_hi, hi, limit - len(out))]
+        return out
+
+    def _top_by_weight(self, lo: int, hi: int, k: int) -> list[int]:
+        """
+        [lo, hi) 中权重最大的 k 条（同权重按位置），按权重降序返回下标。
+        整组在区间内的记录先按组的最大权重入堆，弹出时才展开成单条，
+        所以只需看 区间组数 + k 个组 的权重，而不是区间里的每一条。
+        """
+        heap: list[tuple[int, int, bool]] = []  # (-权重, 下标或组起点, 是否为整组)
+        b = self._block
+        first, last = -(-lo // b), hi // b
+        if first >= last:
+            heap.extend((-self._weights[i], i, False) for i in range(lo, hi))
+        else:
+            heap.extend((-self._weights[i], i, False) for i in range(lo, first * b))
+            heap.extend((-self._weights[i], i, False) for i in range(last * b, hi))
+            heap.extend((-self._block_max[g], g * b, True) for g in range(first, last))
+        heapq.heapify(heap)
+        out: list[int] = []
+        while heap and len(out) < k:
+            _, i, whole = heapq.heappop(heap)
+            if whole:
+                for j in range(i, i + b):
+                    heapq.heappush(heap, (-self._weights[j], j, False))
+            else:
+                out.append(i)
+        return out
+
+
+def cmd_lookup(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(prog="main.py lookup", description="查询编码（或前缀）对应的候选")
+    ap.add_argument("query", nargs="+")
+    ap.add_argument("--index", default=OUT_INDEX)
+    ap.add_argument("-n", type=int, default=LOOKUP_LIMIT)
+    args = ap.parse_args(argv)
+    try:
+        idx = CandidateIndex(args.index)
+    except BuildError as e:
+        print(e, file=sys.stderr)
+        return 1
+    try:
+        for q in args.query:
+            for text, code, weight in idx.lookup(q, args.n):
+                print(format_rime_line(text, code, weight))
+    finally:
+        idx.close()
+    return 0
+
+
+def cmd_serve(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        prog="main.py serve",
+        description="本地查询服务：默认从标准输入逐行读查询；--http 时提供 GET /lookup?q=编码&n=个数",
+    )
+    ap.add_argument("--index", default=OUT_INDEX)
+    ap.add_argument("--http", type=int, metavar="PORT", help="以 HTTP 方式监听该端口")
+    ap.add_argument("--host", default=LOOKUP_HTTP_HOST)
+    args = ap.parse_args(argv)
+    try:
+        idx = CandidateIndex(args.index)
+    except BuildError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    if args.http is None:
+        # 每行一个查询；每个结果一行，结果之间空一行
+        try:
+            for line in sys.stdin:
+                q = line.strip()
+                for text, code, weight in idx.lookup(q):
+                    sys.stdout.write(format_rime_line(text, code, weight) + "\n")
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+        finally:
+            idx.close()
+        return 0
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/lookup":
+                self.send_error(404)
+                return
+            qs = parse_qs(url.query)
+            q = qs.get("q", [""])[0]
+            try:
+                n = int(qs.get("n", [str(LOOKUP_LIMIT)])[0])
+            except ValueError:
+                self.send_error(400, "n 必须是整数")
+                return
+            body = json.dumps(
+                [{"text": t, "code": c, "weight": w} for t, c, w in idx.lookup(q, n)],
+                ensure_ascii=False,
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((args.host, args.http), Handler)
+    print(f"查询服务已启动：http://{args.host}:{args.http}/lookup?q=lingmeng", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        idx.close()
+    return 0
+
+
+def cmd_bench(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(prog="main.py bench", description="候选查询延迟测试")
+    ap.add_argument("--index", default=OUT_INDEX)
+    ap.add_argument("--queries", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    try:
+        idx = CandidateIndex(args.index)
+    except BuildError as e:
+        print(e, file=sys.stderr)
+        return 1
+    startup_us = (time.perf_counter() - t0) * 1e6
+    if idx.count == 0:
+        print("索引为空。", file=sys.stderr)
+        idx.close()
+        return 1
+
+    # 随机取若干条记录的键，截成随机长度的前缀作为查询
+    rng = random.Random(args.seed)
+    queries = []
+    for _ in range(args.queries):
+        key = idx._key(rng.randrange(idx.count)).decode("utf-8")
+        queries.append(key[:rng.randint(1, len(key))])
+
+    samples = []
+    for q in queries:
+        t = time.perf_counter_ns()
+        idx.lookup(q)
+        samples.append(time.perf_counter_ns() - t)
+    idx.close()
+
+    samples.sort()
+    def pct(p: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * p))] / 1000
+
+    print(
+        f"索引：{args.index}（{idx.count} 条），启动 {startup_us:.0f} µs\n"
+        f"查询 {len(samples)} 次：p50 {pct(0.50):.1f} µs，p90 {pct(0.90):.1f} µs，"
+        f"p99 {pct(0.99):.1f} µs，max {samples[-1] / 1000:.1f} µs"
+    )
+    return 0
+
+
+# ---------- SQLite 导出（--sqlite）：一个事务批量插入，之后再建索引和 FTS ----------
+SQLITE_SCHEMA_VERSION = 1  # 写在 PRAGMA user_version 里，表结构变了就加一
+
+_SQLITE_SCHEMA = """
+CREATE TABLE entries (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    code TEXT NOT NULL,      -- 全拼，音节之间空格分隔
+    initials TEXT NOT NULL,  -- 简拼（各音节首字母）
+    weight INTEGER NOT NULL,
+    category TEXT NOT NULL,  -- 分类（同 --shards，见 SHARD_RULES）；extra 块为 extra
+    source TEXT,             -- 来源词表、行号、列号（从 1 开始）；extra 块为 NULL
+    row INTEGER,
+    col INTEGER
+);
+"""
+
+# trigram 分词：任意 3 个字以上的子串都能走 FTS（MATCH），更短的子串用 LIKE
+_SQLITE_INDEXES = """
+CREATE INDEX entries_text ON entries(text);
+CREATE INDEX entries_code ON entries(code);
+CREATE INDEX entries_initials ON entries(initials);
+CREATE INDEX entries_category ON entries(category);
+CREATE VIRTUAL TABLE entries_fts USING fts5(text, content='entries', content_rowid='id', tokenize='trigram');
+INSERT INTO entries_fts(entries_fts) VALUES ('rebuild');
+"""
+
+
+def sqlite_rows(
+    lines: list[str],
+    provs: array,
+    tables: list[tuple[list[list[str]], list[int] | None]],
+    source_names: list[str],
+    origins: list[list[tuple[str, int] | None]],
+    extra_text: str,
+) -> Iterator[tuple[str, str, int, str, str | None, int | None, int | None]]:
+    """全拼输出的每一行（按来源查出分类）+ extra 块：(text, code, weight, category, source, row, col)"""
+    categories: dict[tuple[int, int], tuple[str, str, int]] = {}
+    for line, prov in zip(lines, provs):
+        parsed = parse_dict_line(line)
+        if parsed is None:
+            continue
+        sid, row, col = unpack_provenance(prov)
+        hit = categories.get((sid, col))
+        if hit is None:
+            rows, cols = tables[sid]
+            c = cols.index(col) if cols is not None else col
+            source, source_col = column_origin(origins[sid], source_names[sid], col)
+            hit = categories[sid, col] = (shard_of_header(column_header(rows, c)), source, source_col)
+        category, source, source_col = hit
+        yield (*parsed, category, source, row, source_col + 1)
+    for line in extra_text.strip().splitlines():
+        parsed = parse_dict_line(line)
+        if parsed is not None:
+            yield (*parsed, "extra", None, None, None)
+
+
+def sqlite_bytes(rows: Iterable[tuple[str, str, int, str, str | None, int | None, int | None]]) -> tuple[bytes, int]:
+    """
+    生成数据库文件的内容，返回 (内容, 条数)。先建表、在一个事务里用 executemany 批量插入，
+    最后再建索引和 FTS（比边插入边维护索引快得多）。数据库在临时目录里生成，由 write_outputs 原子写出。
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "entries.sqlite3"
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+            conn.executescript(_SQLITE_SCHEMA)
+            with conn:
+                cur = conn.executemany(
+                    "INSERT INTO entries (text, code, initials, weight, category, source, row, col) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (text, code, "".join(t[0] for t in code.split()), weight, category, source, row, col)
+                        for text, code, weight, category, source, row, col in rows
+                    ),
+                )
+                count = cur.rowcount
+            try:
+                conn.executescript(_SQLITE_INDEXES)
+            except sqlite3.OperationalError as e:
+                raise BuildError(
+                    f"当前 Python 自带的 SQLite {sqlite3.sqlite_version} 不支持 FTS5 trigram 分词（需要 3.34 以上）：{e}"
+                ) from e
+        finally:
+            conn.close()
+        return path.read_bytes(), count
+
+
+# ---------- 来源说明：词/编码 -> 哪个单元格、哪条规则、哪个读音表 ----------
+ORIGIN_DEFAULT = 0  # pypinyin 默认读音
+ORIGIN_WORD = 1     # CUSTOM_WORD_PINYIN 整词
+ORIGIN_CHAR = 2     # 含 CUSTOM_PINYIN 单字
+ORIGIN_EXPAND = 3   # --multi-expand 展开的其它读音
+ORIGIN_MODEL = 4    # --polyphone-model 按邻字选的读音
+ORIGIN_NAMES = (
+    "pypinyin 默认读音", "整词自定义 CUSTOM_WORD_PINYIN", "含单字自定义 CUSTOM_PINYIN", "多音字展开",
+    "多音字模型 --polyphone-model",
+)
+
+# 每条输出的“怎么来的”压成一个字节：name_rule | origin << 2 | 繁体 << 5
+_HOW_TRAD = 1 << 5
+
+
+def pack_how(rule: int, origin: int, trad: bool = False) -> int:
+    return rule | (origin << 2) | (_HOW_TRAD if trad else 0)
+
+
+def unpack_how(how: int) -> tuple[int, int, bool]:
+    return how & 3, (how >> 2) & 7, bool(how & _HOW_TRAD)
+
+
+_EXPLAIN_MAGIC = b"THDEXP1\0"
+_EXPLAIN_HEADER = struct.Struct("<8sI")
+_EXPLAIN_LEN = struct.Struct("<I")
+
+
+def explain_keys(text: str, code: str) -> tuple[bytes, bytes]:
+    return ("w:" + text).encode("utf-8"), ("c:" + lookup_key(code)).encode("utf-8")
+
+
+def explain_index_bytes(groups: dict[bytes, list[dict]]) -> bytes:
+    """
+    生成来源说明索引。文件格式（小端）：
+      magic(8) | 槽数 M(uint32，2 的幂) | slots[M](uint32) | 记录区
+    键按 crc32 放入开放寻址表（线性探测），槽里存 记录偏移 + 1（0 表示空）；
+    每条记录为 长度(uint32) + 键 + b"\0" + JSON（该键的全部说明）。查询只需几次探测，与条数无关。
+    """
+    m = 1
+    while m < 2 * len(groups):
+        m <<= 1
+    slots = array("I", bytes(4 * m))
+    blob = bytearray()
+    for key, records in groups.items():
+        i = zlib.crc32(key) & (m - 1)
+        while slots[i]:
+            i = (i + 1) & (m - 1)
+        slots[i] = len(blob) + 1
+        rec = key + b"\0" + json.dumps(records, ensure_ascii=False).encode("utf-8")
+        blob += _EXPLAIN_LEN.pack(len(rec)) + rec
+    if sys.byteorder != "little":
+        slots.byteswap()
+    return _EXPLAIN_HEADER.pack(_EXPLAIN_MAGIC, m) + slots.tobytes() + bytes(blob)
+
+
+class ExplainIndex:
+    """mmap 打开的来源说明索引"""
+
+    def __init__(self, path: str | Path):
+        try:
+            self._file = Path(path).open("rb")
+        except FileNotFoundError:
+            raise BuildError(f"找不到来源说明索引：{Path(path).resolve()}（先用 --explain 构建）") from None
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, m = _EXPLAIN_HEADER.unpack_from(self._mm, 0)
+        if magic != _EXPLAIN_MAGIC:
+            self._mm.close()
+            self._file.close()
+            raise BuildError(f"不是来源说明索引文件（或是旧版本生成的，请用 --explain 重新构建）：{path}")
+        self._m = m
+        view = memoryview(self._mm)
+        self._data_start = _EXPLAIN_HEADER.size + 4 * m
+        self._slots = _uint32_view(view[_EXPLAIN_HEADER.size:self._data_start])
+        view.release()
+
+    def close(self) -> None:
+        if isinstance(self._slots, memoryview):
+            self._slots.release()
+        self._mm.close()
+        self._file.close()
+
+    def _get(self, key: bytes) -> list[dict]:
+        i = zlib.crc32(key) & (self._m - 1)
+        while True:
+            slot = self._slots[i]
+            if not slot:
+                return []
+            start = self._data_start + slot - 1
+            (n,) = _EXPLAIN_LEN.unpack_from(self._mm, start)
+            rec = self._mm[start + 4:start + 4 + n]
+            k, _, value = rec.partition(b"\0")
+            if k == key:
+                return json.loads(value)
+            i = (i + 1) & (self._m - 1)
+
+    def explain(self, query: str) -> list[dict]:
+        """先按词查，再按编码查（编码不区分空格和大小写）"""
+        word_key, code_key = explain_keys(query.strip(), query)
+        return self._get(word_key) + self._get(code_key)
+
+
+def format_explain(rec: dict) -> list[str]:
+    lines = [f"{format_rime_line(rec['text'], rec['code'], rec['weight'])}    [{rec['file']}]"]
+    if "source" not in rec:
+        lines.append("  来源：extra 块（手写条目）")
+        return lines
+    lines.append(
+        f"  来源：{rec['source']} 第 {rec['row']} 行 第 {rec['col']} 列（{rec['header'] or '无表头'}）：{rec['cell']}"
+    )
+    lines.append(f"  拆分：{rec['split']}" + ("，再转为繁体" if rec.get("trad") else ""))
+    lines.append(f"  读音：{rec['reading']}" + (f"（{rec['detail']}）" if rec.get("detail") else ""))
+    return lines
+
+
+def cmd_explain(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        prog="main.py explain",
+        description=f"说明某个词或编码是从哪个单元格、按哪条规则得到的（需要先用 --explain 构建 {OUT_EXPLAIN}）",
+    )
+    ap.add_argument("query", nargs="+", help="词或编码")
+    ap.add_argument("--index", default=OUT_EXPLAIN)
+    args = ap.parse_args(argv)
+    try:
+        idx = ExplainIndex(args.index)
+    except BuildError as e:
+        print(e, file=sys.stderr)
+        return 1
+    try:
+        for q in args.query:
+            records = idx.explain(q)
+            if not records:
+                print(f"{q}：没有找到")
+            for rec in records:
+                print("\n".join(format_explain(rec)))
+    finally:
+        idx.close()
+    return 0
+
+
+# ---------- 检查：疑似错字 / 近似重复 / 多余空白 ----------
+_INVISIBLE = {"\u200b", "\u200c", "\u200d", "\u2060", "\ufeff", "\xa0"}
+
+
+@dataclass
+class Suspect:
+    score: float
+    kind: str
+    texts: tuple[str, ...]
+    where: str
+
+
+def whitespace_suspects(cell: str, where: str) -> Iterator[Suspect]:
+    if cell != cell.strip():
+        yield Suspect(5.0, "首尾空白", (repr(cell),), where)
+    inner = cell.strip()
+    if "  " in inner or "\t" in inner or "\u3000" in inner:
+        yield Suspect(4.0, "多余空白", (repr(cell),), where)
+    if any(ch in _INVISIBLE for ch in inner):
+        yield Suspect(5.0, "不可见字符", (repr(cell),), where)
+
+
+def near_duplicate_pairs(texts: Iterable[str]) -> Iterator[tuple[str, str, str]]:
+    """
+    找出相差一个字的词对，产出 (a, b, "sub" | "indel")。
+
+    不两两比较：每个词把第 i 个字换成占位符作为键放进倒排表（同一个键里的词正好在第 i 位不同），
+    删掉第 i 个字的结果若本身也是词，则两者差一个字（多一字/少一字）。
+    总工作量为 词数 × 词长，同键的词过多（LINT_BUCKET_MAX）时视为规律而非笔误。
+    """
+    words = {t for t in texts if len(t) >= LINT_MIN_LEN - 1}
+    masked: dict[str, list[str]] = {}
+    for t in words:
+        if len(t) < LINT_MIN_LEN:
+            continue
+        for i in range(len(t)):
+            masked.setdefault(t[:i] + "\0" + t[i + 1:], []).append(t)
+            shorter = t[:i] + t[i + 1:]
+            if shorter in words and len(shorter) >= LINT_MIN_LEN - 1 and shorter != t:
+                yield t, shorter, "indel"
+    for bucket in masked.values():
+        if 1 < len(bucket) <= LINT_BUCKET_MAX:
+            bucket.sort()
+            for i, a in enumerate(bucket):
+                for b in bucket[i + 1:]:
+                    yield a, b, "sub"
+
+
+def lint_suspects(tables: list[tuple[list[list[str]], list[int] | None]], source_names: list[str]) -> list[Suspect]:
+    resolver = PinyinResolver()
+    first_seen: dict[str, str] = {}  # 词 -> 第一次出现的位置
+    suspects: list[Suspect] = []
+
+    for sid, (rows, cols) in enumerate(tables):
+        for r, row in enumerate(rows[1:], start=2):
+            for c, cell in enumerate(row):
+                if not cell:
+                    continue
+                col = cols[c] if cols is not None else c
+                where = f"{source_names[sid]}:{r}:{col + 1}"
+                suspects.extend(whitespace_suspects(cell, where))
+                for display_text, _ in expand_name_entries(cell):
+                    first_seen.setdefault(display_text, where)
+
+    codes: dict[str, str] = {}
+    for text in first_seen:
+        if len(text) >= LINT_MIN_LEN - 1:
+            codes[text] = " ".join(resolver.tokens_for_text(text)[0])
+
+    def where(*texts: str) -> str:
+        return " / ".join(first_seen[t] for t in texts)
+
+    pairs = set()
+    for a, b, kind in near_duplicate_pairs(first_seen):
+        key = (min(a, b), max(a, b))
+        if key in pairs:
+            continue
+        pairs.add(key)
+        longer = max(len(a), len(b))
+        weight = 1 - 1 / longer  # 越长的词差一字越可能是笔误
+        if kind == "indel":
+            suspects.append(Suspect(0.8 * weight, "多一字/少一字", key, where(*key)))
+        elif codes.get(a) == codes.get(b):
+            suspects.append(Suspect(3.0 * weight, "同音，差一字", key, where(*key)))
+        else:
+            suspects.append(Suspect(1.0 * weight, "差一字", key, where(*key)))
+
+    # 同音异字（差不止一字）：按编码分组，只看等长、不同字不超过一半的
+    by_code: dict[str, list[str]] = {}
+    for text, code in codes.items():
+        if code and len(text) >= LINT_MIN_LEN:
+            by_code.setdefault(code, []).append(text)
+    for group in by_code.values():
+        if not 1 < len(group) <= LINT_BUCKET_MAX:
+            continue
+        group.sort()
+        for i, a in enumerate(group):
+            for b in group[i + 1:]:
+                if len(a) != len(b) or (a, b) in pairs:
+                    continue
+                diff = sum(x != y for x, y in zip(a, b))
+                if diff * 2 <= len(a):
+                    suspects.append(Suspect(2.0 / diff, "同音异字", (a, b), where(a, b)))
+
+    suspects.sort(key=lambda x: (-x.score, x.kind, x.texts))
+    return suspects
+
+
+def format_suspect(x: Suspect) -> str:
+    return COL_SEP.join([f"{x.score:.2f}", x.kind, " | ".join(x.texts), x.where])
+
+
+def cmd_lint(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        prog="main.py lint",
+        description=f"检查词库源中的疑似错字、近似重复和多余空白，按可疑程度排序（完整列表写入 {OUT_LINT}）",
+    )
+    ap.add_argument("--csv", default=INPUT_CSV, help=f"词库源（默认 {INPUT_CSV}）")
+    ap.add_argument("--xlsx", action="append", default=[], metavar="工作簿.xlsx")
+    ap.add_argument("--source", action="append", default=[], dest="sources", metavar="词表.csv")
+    ap.add_argument("-n", type=int, default=LINT_LIMIT, help=f"终端显示前 N 条（默认 {LINT_LIMIT}）")
+    ap.add_argument("--out", default=OUT_LINT)
+    args = ap.parse_args(argv)
+
+    config = BuildConfig(xlsx=args.xlsx)
+    try:
+        tables = [load_rows(args.csv, config)]
+        tables += [load_rows(p, BuildConfig()) for p in args.sources]
+    except BuildError as e:
+        print(e, file=sys.stderr)
+        return 1
+    suspects = lint_suspects(tables, [args.csv, *args.sources])
+
+    lines = [format_suspect(x) for x in suspects]
+    BuildResult({args.out: join_lines(lines)}, [], None).write()
+    for line in lines[:args.n]:
+        print(line)
+    print(f"共 {len(lines)} 条可疑项，完整列表：{args.out}", file=sys.stderr)
+    return 0
+
+
+# ---------- 多音字模型：从带注音语料训练，给出整词读音建议 ----------
+def _annotation_token(tok: str) -> str:
+    return tok.lower().replace("u:", "v").replace("ü", "v")
+
+
+def iter_annotated_lines(paths: list[str]) -> Iterator[tuple[str, list[str]]]:
+    """带注音语料：每行 “文本<Tab>拼音 拼音 ...[<Tab>权重]”，没有 Tab 的行跳过"""
+    for path in corpus_files(paths):
+        with path.open("r", encoding=CORPUS_ENCODING, errors="replace") as f:
+            for line in f:
+                parts = line.rstrip("\r\n").split(COL_SEP)
+                if len(parts) >= 2 and parts[0].strip():
+                    yield parts[0].strip(), parts[1].split()
+
+
+def train_polyphone_model(
+    lines: Iterable[tuple[str, list[str]]],
+    resolver: PinyinResolver,
+    min_count: int = POLYPHONE_MIN_COUNT,
+    min_conf: float = POLYPHONE_MIN_CONF,
+) -> tuple[PolyphoneModel, int, int]:
+    """
+    统计每个多音字在各个左邻字/右邻字下的读音次数，只保留出现够多、读音够一致的上下文。
+    置信度 = (最多的读音次数 + 1) / (总次数 + 该字的读音数)。
+    只用全是汉字且字数与拼音数相同的行；返回 (模型, 用上的行数, 跳过的行数)。
+    """
+    counts: dict[str, dict[str, int]] = {}
+    n_readings: dict[str, int] = {}
+    used = skipped = 0
+    for text, tokens in lines:
+        if len(tokens) != len(text) or not all(is_han_char(ch) for ch in text):
+            skipped += 1
+            continue
+        used += 1
+        for i, ch in enumerate(text):
+            if ch in resolver.custom_pinyin:
+                continue
+            all_readings = resolver.all_readings(ch)
+            if len(all_readings) <= 1:
+                continue
+            reading = match_reading(ch, _annotation_token(tokens[i])).normal
+            if reading not in all_readings:
+                continue  # 注音和字对不上（错位，或 pypinyin 没有这个读音）
+            n_readings[ch] = len(all_readings)
+            for key in (ch + "<" + text[i - 1] if i else "", ch + ">" + text[i + 1] if i + 1 < len(text) else ""):
+                if key:
+                    per = counts.setdefault(key, {})
+                    per[reading] = per.get(reading, 0) + 1
+
+    contexts: dict[str, tuple[str, float, int]] = {}
+    for key, per in counts.items():
+        total = sum(per.values())
+        if total < min_count:
+            continue
+        reading, n = max(per.items(), key=lambda kv: (kv[1], kv[0]))
+        conf = (n + 1) / (total + n_readings[key[0]])
+        if conf >= min_conf:
+            contexts[key] = (reading, round(conf, 4), total)
+    return PolyphoneModel(contexts), used, skipped
+
+
+def polyphone_suggestions(texts: Iterable[str], resolver: PinyinResolver) -> list[tuple[float, int, str, str, str]]:
+    """
+    模型改了读音的词：[(置信度, 次数, 词, 全拼, 依据)]，按置信度、次数从高到低。
+    一个词里有几个字被改时，置信度和次数取其中最低的。
+    """
+    out: list[tuple[float, int, str, str, str]] = []
+    for text in dict.fromkeys(texts):
+        picks = resolver.model_picks(text)
+        if not picks:
+            continue
+        tokens, _, has_unparsed = resolver.tokens_for_text(text)
+        if has_unparsed:
+            continue
+        conf = min(p[2] for p in picks)
+        count = min(resolver.model.contexts[p[3]][2] for p in picks)
+        why = "、".join(f"{PolyphoneModel.describe(key)} 读 {reading}" for _, reading, _, key in picks)
+        out.append((conf, count, text, " ".join(tokens), why))
+    out.sort(key=lambda x: (-x[0], -x[1], x[2]))
+    return out
+
+
+def cmd_polyphone(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        prog="main.py polyphone",
+        description=(
+            f"从带注音的语料学习多音字在不同邻字下的读音，写出模型 {POLYPHONE_MODEL}（构建时用 --polyphone-model 启用），"
+            f"并按置信度列出建议加入 CUSTOM_WORD_PINYIN 的词（完整列表写入 {OUT_POLYPHONE_SUGGEST}）"
+        ),
+    )
+    ap.add_argument("corpus", nargs="+", help=f"带注音语料文件或目录（每行 “文本<Tab>拼音”，如 Rime 词库；目录下读取 {CORPUS_GLOB}）")
+    ap.add_argument("--csv", default=INPUT_CSV, help=f"要给出建议的词库源（默认 {INPUT_CSV}）")
+    ap.add_argument("--xlsx", action="append", default=[], metavar="工作簿.xlsx")
+    ap.add_argument("--min-count", type=int, default=POLYPHONE_MIN_COUNT, help=f"上下文最少出现次数（默认 {POLYPHONE_MIN_COUNT}）")
+    ap.add_argument("--min-conf", type=float, default=POLYPHONE_MIN_CONF, help=f"最低置信度（默认 {POLYPHONE_MIN_CONF}）")
+    ap.add_argument("-n", type=int, default=POLYPHONE_LIMIT, help=f"终端显示前 N 条（默认 {POLYPHONE_LIMIT}）")
+    ap.add_argument("--model", default=POLYPHONE_MODEL, help="模型写到哪里")
+    ap.add_argument("--out", default=OUT_POLYPHONE_SUGGEST)
+    args = ap.parse_args(argv)
+
+    try:
+        model, used, skipped = train_polyphone_model(
+            iter_annotated_lines(args.corpus), PinyinResolver(), args.min_count, args.min_conf
+        )
+        rows, _ = load_rows(args.csv, BuildConfig(xlsx=args.xlsx))
+    except BuildError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    resolver = PinyinResolver(model=model)
+    texts = (source for r in rows[1:] for cell in r if cell.strip() for _, source in expand_name_entries(cell.strip()))
+    lines = [
+        f'    "{text}": "{code}",  # {conf:.2f} {why}（{count} 次）'
+        for conf, count, text, code, why in polyphone_suggestions(texts, resolver)
+    ]
+    BuildResult({args.model: model.to_json(), args.out: join_lines(lines)}, [], None).write()
+    for line in lines[:args.n]:
+        print(line)
+    print(
+        f"语料可用 {used} 行（{skipped} 行不是纯汉字或字数与拼音数不同，已跳过），学到 {len(model.contexts)} 个上下文；"
+        f"共 {len(lines)} 条建议：{args.out}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+# ---------- 发布：与上一版做有序归并比较 ----------
+def iter_dict_file(path: str | Path) -> Iterator[tuple[str, str, int]]:
+    """逐行读词库文件（文本<Tab>编码<Tab>权重），不一次读入"""
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            parsed = parse_dict_line(line.rstrip("\n"))
+            if parsed is not None:
+                yield parsed
+
+
+def sorted_entries(entries: Iterable[tuple[str, str, int]]) -> list[tuple[str, str, int]]:
+    """按 (文本, 编码) 排序并去重；同一 (文本, 编码) 保留权重最高的"""
+    out: list[tuple[str, str, int]] = []
+    for text, code, weight in sorted(entries, key=lambda e: (e[0], e[1], -e[2])):
+        if not out or out[-1][:2] != (text, code):
+            out.append((text, code, weight))
+    return out
+
+
+def _text_groups(entries: Iterable[tuple[str, str, int]]) -> Iterator[tuple[str, dict[str, int]]]:
+    last = None
+    group: dict[str, int] = {}
+    for text, code, weight in entries:
+        if last is not None and text < last:
+            raise BuildError(f"条目没有按文本排序：{last} 之后出现 {text}")
+        if text != last:
+            if last is not None:
+                yield last, group
+            last, group = text, {}
+        group[code] = weight
+    if last is not None:
+        yield last, group
+
+
+def diff_sorted_entries(
+    old: Iterable[tuple[str, str, int]], new: Iterable[tuple[str, str, int]]
+) -> Iterator[tuple[str, dict[str, int], dict[str, int]]]:
+    """
+    两份按文本排序的条目流做归并，产出有差别的词：(文本, 旧的 编码->权重, 新的 编码->权重)。
+    每边只往前读一次，同一时刻只持有一个词的条目。
+    """
+    empty: dict[str, int] = {}
+    old_it, new_it = _text_groups(old), _text_groups(new)
+    o, n = next(old_it, None), next(new_it, None)
+    while o is not None or n is not None:
+        if n is None or (o is not None and o[0] < n[0]):
+            yield o[0], o[1], empty
+            o = next(old_it, None)
+        elif o is None or n[0] < o[0]:
+            yield n[0], empty, n[1]
+            n = next(new_it, None)
+        else:
+            if o[1] != n[1]:
+                yield o[0], o[1], n[1]
+            o, n = next(old_it, None), next(new_it, None)
+
+
+def changelog_items(label: str, words: list[str]) -> str:
+    shown = "、".join(words[:RELEASE_CHANGELOG_MAX])
+    more = " 等" if len(words) > RELEASE_CHANGELOG_MAX else ""
+    return f"- {label} {len(words)} 个：{shown}{more}"
+
+
+def cmd_release(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        prog="main.py release",
+        description="把这次构建的词库与上一版比较，输出增量词库和更新说明，并更新条目快照",
+    )
+    ap.add_argument("--new", default=OUT_ALL, help=f"这次的词库（默认 {OUT_ALL}）")
+    ap.add_argument("--prev", default=RELEASE_SNAPSHOT, help=f"上一版的条目快照（默认 {RELEASE_SNAPSHOT}）")
+    t = time.localtime()
+    ap.add_argument("--version", default=f"{t.tm_year % 100}.{t.tm_mon}.{t.tm_mday}", help="更新说明里的版本号")
+    ap.add_argument("--dry-run", action="store_true", help="只显示更新说明，不写文件")
+    args = ap.parse_args(argv)
+
+    if not Path(args.new).exists():
+        print(f"找不到输入文件：{Path(args.new).resolve()}", file=sys.stderr)
+        return 1
+    new = sorted_entries(iter_dict_file(args.new))
+    old = iter_dict_file(args.prev) if Path(args.prev).exists() else iter(())
+
+    added: list[str] = []
+    removed: list[str] = []
+    recoded: list[str] = []
+    reweighted: list[str] = []
+    add_lines: list[str] = []
+    remove_lines: list[str] = []
+    try:
+        for text, before, after in diff_sorted_entries(old, new):
+            for code, weight in after.items():
+                if before.get(code) != weight:
+                    add_lines.append(format_rime_line(text, code, weight))
+            for code, weight in before.items():
+                if code not in after:
+                    remove_lines.append(format_rime_line(text, code, weight))
+            if not before:
+                added.append(text)
+            elif not after:
+                removed.append(text)
+            elif before.keys() != after.keys():
+                gone = [c for c in before if c not in after]
+                came = [c for c in after if c not in before]
+                recoded.append(f"{text}（{' / '.join(gone) or '-'} -> {' / '.join(came) or '-'}）")
+            else:
+                reweighted.append(text)
+    except BuildError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    section = [args.version]
+    for label, words in (("新增", added), ("删除", removed), ("改编码", recoded), ("改权重", reweighted)):
+        if words:
+            section.append(changelog_items(label, words))
+    if len(section) == 1:
+        section.append("- 没有变化")
+    print("\n".join(section))
+    if args.dry_run:
+        return 0
+
+    old_log = Path(RELEASE_CHANGELOG).read_text(encoding="utf-8") if Path(RELEASE_CHANGELOG).exists() else ""
+    BuildResult({
+        RELEASE_DELTA_ADD: join_lines(add_lines),
+        RELEASE_DELTA_REMOVE: join_lines(remove_lines),
+        RELEASE_CHANGELOG: "\n".join(section) + "\n\n" + old_log,
+        RELEASE_SNAPSHOT: join_lines([format_rime_line(*e) for e in new]),
+    }, [], None).write()
+    print(
+        f"\n{RELEASE_DELTA_ADD}: {len(add_lines)} 行\n{RELEASE_DELTA_REMOVE}: {len(remove_lines)} 行\n"
+        f"{RELEASE_SNAPSHOT}: {len(new)} 条（下次发布与此比较）",
+        file=sys.stderr,
+    )
+    return 0
+
+
+COMMANDS = {
+    "lookup": cmd_lookup,
+    "serve": cmd_serve,
+    "bench": cmd_bench,
+    "explain": cmd_explain,
+    "lint": cmd_lint,
+    "release": cmd_release,
+    "polyphone": cmd_polyphone,
+}
+
+
+# ---------- xlsx 工作簿：只读流式解析 + 按文件哈希缓存 ----------
+def _cell_text(v: object) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def parse_xlsx_rows(path: str | Path) -> tuple[list[list[str]], list[tuple[str, int]]]:
+    """
+    用 openpyxl 的只读模式逐行读出所有工作表（不建整个文档树），单元格都转成字符串。
+    多个工作表按列并排，和 merge_columns 的结果一样；另外返回每个工作表的 (名称, 列数)。
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise BuildError("缺少依赖：openpyxl（读取 xlsx 需要）。请先运行：pip install openpyxl") from None
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows: list[list[str]] = []
+        sheets: list[tuple[str, int]] = []
+        for ws in wb.worksheets:
+            sheet = [[_cell_text(v) for v in r] for r in ws.iter_rows(values_only=True)]
+            rows = merge_columns(rows, sheet) if rows else sheet
+            sheets.append((ws.title, max((len(r) for r in sheet), default=0)))
+        return rows, sheets
+    finally:
+        wb.close()
+
+
+def file_sha256(path: str | Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _read_xlsx_rows(digest: str, path: str) -> tuple[tuple[tuple[str, ...], ...], tuple[tuple[str, int], ...]]:
+    # 缓存文件名：文件名.路径哈希.内容哈希.json；同一路径只留最新的一份，工作簿改过之后旧缓存随即删掉
+    prefix = f"{Path(path).stem}.{hashlib.sha256(str(Path(path).resolve()).encode()).hexdigest()[:8]}."
+    cache = Path(XLSX_CACHE_DIR) / f"{prefix}{digest[:16]}.json"
+    try:
+        data = json.loads(cache.read_text(encoding="utf-8"))
+        rows, sheets = data["rows"], data["sheets"]
+    except (FileNotFoundError, ValueError, TypeError, KeyError):
+        rows, sheets = parse_xlsx_rows(path)
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(cache, json.dumps({"rows": rows, "sheets": sheets}, ensure_ascii=False).encode("utf-8"))
+        for old in cache.parent.iterdir():
+            if old != cache and old.name.startswith(prefix) and old.suffix == ".json":
+                old.unlink(missing_ok=True)
+    return tuple(tuple(r) for r in rows), tuple((name, width) for name, width in sheets)
+
+
+def read_xlsx_table(path: str | Path) -> tuple[list[list[str]], list[tuple[str, int]]]:
+    """
+    读 xlsx 工作簿为行列表（第一行为标题），同时返回每列的出处 (“文件 工作表 名称”, 在该工作表中的列号)。
+    解析结果按文件内容哈希缓存到 XLSX_CACHE_DIR，同一进程内也只解析一次；
+    XLSX_SKIP_HEADERS 中的列、以及和本列表头相同的单元格（表中间重复的标题行）会被去掉。
+    """
+    in_path = Path(path)
+    if not in_path.exists():
+        raise BuildError(f"找不到输入文件：{in_path.resolve()}")
+    rows, sheets = _read_xlsx_rows(file_sha256(in_path), str(in_path))
+    if not rows:
+        return [], []
+    sheet_cols = [(f"{path} 工作表 {name}", c) for name, width in sheets for c in range(width)]
+    width = max(len(r) for r in rows)
+    header = [header_name(h) for h in rows[0]] + [""] * (width - len(rows[0]))
+    keep = [c for c, h in enumerate(header) if h not in XLSX_SKIP_HEADERS]
+    out = [[header[c] for c in keep]]
+    for r in rows[1:]:
+        out.append([
+            "" if c >= len(r) or (header[c] and r[c].strip() == header[c]) else r[c]
+            for c in keep
+        ])
+    return out, [sheet_cols[c] for c in keep]
+
+
+def read_xlsx_rows(path: str | Path) -> list[list[str]]:
+    return read_xlsx_table(path)[0]
+
+
+def merge_columns(base: list[list[str]], extra: list[list[str]]) -> list[list[str]]:
+    """把 extra 的列追加到 base 的列后面（行数不同时补空单元格）"""
+    width = max((len(r) for r in base), default=0)
+    merged: list[list[str]] = []
+    for i in range(max(len(base), len(extra))):
+        left = base[i] if i < len(base) else []
+        right = extra[i] if i < len(extra) else []
+        merged.append(left + [""] * (width - len(left)) + right)
+    return merged
+
+
+# ---------- 输出写入：原子替换 + 内容哈希清单 ----------
+def _encode_output(content: str | bytes) -> bytes:
+    if isinstance(content, bytes):
+        return content
+    # 与 Path.write_text 一致：换行按系统习惯（Windows 上是 CRLF）
+    return content.replace("\n", os.linesep).encode("utf-8")
+
+
+@lru_cache(maxsize=None)
+def _new_file_mode() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return 0o666 & ~mask
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """先写同目录下的临时文件再 os.replace，读者要么看到旧文件，要么看到完整的新文件"""
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        # mkstemp 建的文件只有本人可读写，改成和普通新建文件一样的权限
+        os.chmod(tmp, path.stat().st_mode & 0o777 if path.exists() else _new_file_mode())
+        with os.fdopen(fd, "wb", buffering=1 << 20) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def write_outputs(files: dict[str, str | bytes], manifest: bool = False) -> list[str]:
+    """
+    写出一组文件，返回真正重写了的路径。目录不存在时创建。
+
+    manifest 为真（构建输出）时，各目录下的 OUT_MANIFEST_NAME 记录文件的 sha256、大小和修改时间：
+    哈希相同且文件没被外部改过（大小、修改时间都对得上）时直接跳过；
+    清单对不上（或不用清单）时再读出现有文件比较一次，内容相同也不重写。
+    """
+    by_dir: dict[Path, list[tuple[Path, bytes]]] = {}
+    for path, content in files.items():
+        p = Path(path)
+        by_dir.setdefault(p.parent, []).append((p, _encode_output(content)))
+
+    written: list[str] = []
+    for folder, items in by_dir.items():
+        folder.mkdir(parents=True, exist_ok=True)
+        manifest_path = folder / OUT_MANIFEST_NAME
+        try:
+            entries: dict[str, dict] = json.loads(manifest_path.read_text(encoding="utf-8")) if manifest else {}
+        except (FileNotFoundError, ValueError):
+            entries = {}
+        before = dict(entries)
+
+        for p, data in items:
+            digest = hashlib.sha256(data).hexdigest()
+            entry = entries.get(p.name)
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                st = None
+            unchanged = st is not None and (
+                (entry is not None and entry.get("sha256") == digest
+                 and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns)
+                or (st.st_size == len(data) and p.read_bytes() == data)
+            )
+            if not unchanged:
+                atomic_write_bytes(p, data)
+                written.append(str(p))
+                st = p.stat()
+            entries[p.name] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+        if manifest and entries != before:
+            atomic_write_bytes(
+                manifest_path,
+                (json.dumps(entries, ensure_ascii=False, indent=2, sort_keys=True) + "\n").encode("utf-8"),
+            )
+    return written
+
+
+# ---------- 语料权重：mmap + Aho-Corasick 多模式计数 ----------
+class AhoCorasick:
+    """
+    按字构建的 Aho-Corasick 自动机：一遍扫描文本，统计所有词各出现多少次（包括互相包含的词）。
+    """
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = patterns
+        goto: list[dict[str, int]] = [{}]
+        out: list[list[int]] = [[]]
+        for pid, word in enumerate(patterns):
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(pid)
+
+        # 按层（BFS）求失败指针，并把后缀状态的输出并进来
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt].extend(out[fail[nxt]])
+                queue.append(nxt)
+        self._goto = goto
+        self._fail = fail
+        self._out = [tuple(o) for o in out]
+
+    def feed(self, text: str, state: int = 0, counts: list[int] | None = None) -> int:
+        """从 state 开始扫描 text；给了 counts 时累加命中次数。返回结束时的状态（可接着扫下一段）"""
+        goto, fail, out = self._goto, self._fail, self._out
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if counts is not None and out[state]:
+                for pid in out[state]:
+                    counts[pid] += 1
+        return state
+
+
+_CORPUS_MATCHER: AhoCorasick | None = None  # 只在语料进程池的工作进程里设置
+
+
+def _corpus_worker_init(patterns: list[str]) -> None:
+    global _CORPUS_MATCHER
+    _CORPUS_MATCHER = AhoCorasick(patterns)
+
+
+def _utf8_boundary(mm: mmap.mmap, pos: int) -> int:
+    """往后挪到下一个 UTF-8 字符的起点"""
+    while pos < len(mm) and mm[pos] & 0xC0 == 0x80:
+        pos += 1
+    return pos
+
+
+def _count_chunk(matcher: AhoCorasick, path: str, start: int, end: int, overlap: int) -> list[int]:
+    """
+    统计结束位置落在 [start, end) 内的命中：先用前面 overlap 字节“预热”自动机（不计数），
+    这样跨块边界的词只会在它结尾所在的那一块里算一次。
+    """
+    counts = [0] * len(matcher.patterns)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pre = _utf8_boundary(mm, max(0, start - overlap))
+        state = matcher.feed(mm[pre:start].decode(CORPUS_ENCODING, errors="ignore"))
+        matcher.feed(mm[start:end].decode(CORPUS_ENCODING, errors="ignore"), state, counts)
+    return counts
+
+
+def _count_chunk_in_worker(path: str, start: int, end: int, overlap: int) -> list[int]:
+    return _count_chunk(_CORPUS_MATCHER, path, start, end, overlap)
+
+
+def corpus_files(paths: list[str]) -> list[Path]:
+    files: list[Path] = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(sorted(x for x in p.rglob(CORPUS_GLOB) if x.is_file()))
+        elif p.exists():
+            files.append(p)
+        else:
+            raise BuildError(f"找不到语料：{p.resolve()}")
+    return files
+
+
+def corpus_counts(
+    words: list[str], paths: list[str], jobs: int | None = None, progress: Progress | None = None
+) -> tuple[list[int], int]:
+    """
+    统计 words 在语料中各出现多少次，返回 (次数列表, 扫描的字节数)。
+    文件用 mmap 打开、按 CORPUS_CHUNK 切块，多个块在进程池里并行扫描后相加；
+    给出 progress 时按块报告进度（“语料”阶段从切块完成、知道总块数时开始）。
+    """
+    files = corpus_files(paths)
+    overlap = 4 * max((len(w) for w in words), default=1)  # UTF-8 每字最多 4 字节
+    tasks: list[tuple[str, int, int, int]] = []
+    total = 0
+    for path in files:
+        size = path.stat().st_size
+        if not size:
+            continue
+        total += size
+        with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            bounds = sorted({0, size, *(_utf8_boundary(mm, i) for i in range(CORPUS_CHUNK, size, CORPUS_CHUNK))})
+        tasks.extend((str(path), a, b, overlap) for a, b in zip(bounds, bounds[1:]))
+
+    progress = progress or Progress()
+    progress.stage("corpus", "语料", len(tasks), "块", sample=1)
+    counts = [0] * len(words)
+
+    def add(part: list[int]) -> None:
+        for i, n in enumerate(part):
+            if n:
+                counts[i] += n
+        progress.tick()
+
+    if not tasks:
+        return counts, total
+    if len(tasks) == 1 or jobs == 1:
+        matcher = AhoCorasick(words)  # 本进程里不经全局变量，同时进行的多次构建互不干扰
+        for t in tasks:
+            add(_count_chunk(matcher, *t))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_corpus_worker_init, initargs=(words,)) as ex:
+            for fut in as_completed([ex.submit(_count_chunk_in_worker, *t) for t in tasks]):
+                add(fut.result())
+    return counts, total
+
+
+def tier_weight(count: int, default: int = WEIGHT) -> int:
+    for min_count, weight in CORPUS_TIERS:
+        if count >= min_count:
+            return weight
+    return default
+
+
+# ---------- 进度与吞吐量（--progress / --metrics） ----------
+def cache_counts() -> tuple[int, int]:
+    """读音相关的模块级缓存累计的 (命中, 未命中)"""
+    hits = misses = 0
+    for fn in (pypinyin_char_readings, match_reading, has_tone, number_chars):
+        info = fn.cache_info()
+        hits += info.hits
+        misses += info.misses
+    return hits, misses
+
+
+@dataclass
+class StageStat:
+    name: str    # 英文名，用作 Prometheus 标签
+    label: str   # 显示用的中文名
+    unit: str
+    total: int
+    count: int = 0
+    seconds: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+
+class Progress:
+    """
+    按阶段计数。tick 只做加法和一次比较，每 sample 项（默认 PROGRESS_SAMPLE）才看一次时钟，
+    距上次报告超过 interval 秒才往 stream 打一行；stream 为 None 时只计数（供 --metrics）。
+    """
+
+    def __init__(self, stream=None, interval: float = PROGRESS_INTERVAL):
+        self.stream = stream
+        self.interval = interval
+        self.stages: list[StageStat] = []
+        self.started = time.perf_counter()
+        self._current: StageStat | None = None
+
+    def stage(self, name: str, label: str, total: int = 0, unit: str = "项", sample: int = PROGRESS_SAMPLE) -> None:
+        """
+        结束上一阶段（如果有），开始新阶段；total 为 0 表示不知道总量（不估剩余时间）。
+        每项本身就很慢的阶段（语料块、输出文件）用 sample=1，每次 tick 都看时钟。
+        """
+        self.done()
+        self._current = StageStat(name, label, unit, total)
+        self._count = 0
+        self._sample = sample
+        self._next_check = sample
+        self._t0 = self._last_report = time.perf_counter()
+        self._cache0 = cache_counts()
+
+    def tick(self, n: int = 1) -> None:
+        self._count += n
+        if self._count >= self._next_check:
+            self._next_check = self._count + self._sample
+            now = time.perf_counter()
+            if self.stream is not None and now - self._last_report >= self.interval:
+                self._last_report = now
+                self._print(self._snapshot(now), finished=False)
+
+    def done(self, count: int | None = None) -> None:
+        """结束当前阶段；count 给出时代替 tick 的累计（只在结束时才知道数量的阶段用）"""
+        st = self._current
+        if st is None:
+            return
+        if count is not None:
+            self._count = count
+        self._snapshot(time.perf_counter())
+        self.stages.append(st)
+        self._current = None
+        if self.stream is not None:
+            self._print(st, finished=True)
+
+    def _snapshot(self, now: float) -> StageStat:
+        st = self._current
+        hits, misses = cache_counts()
+        st.count = self._count
+        st.seconds = now - self._t0
+        st.cache_hits = hits - self._cache0[0]
+        st.cache_misses = misses - self._cache0[1]
+        return st
+
+    def _print(self, st: StageStat, finished: bool) -> None:
+        rate = st.count / st.seconds if st.seconds > 0 else 0.0
+        lookups = st.cache_hits + st.cache_misses
+        parts = [f"[{st.label}]"]
+        if finished:
+            parts.append(f"完成 {st.count} {st.unit}，{st.seconds:.2f} 秒" if st.count else f"{st.seconds:.2f} 秒")
+        else:
+            parts.append(f"{st.count}/{st.total} {st.unit}" if st.total else f"{st.count} {st.unit}")
+        if st.count:
+            parts.append(f"{rate:.0f} {st.unit}/秒")
+        if lookups:
+            parts.append(f"缓存命中 {st.cache_hits / lookups:.1%}")
+        if not finished and st.total and rate > 0:
+            parts.append(f"剩余约 {(st.total - st.count) / rate:.0f} 秒")
+        print("  ".join(parts), file=self.stream, flush=True)
+
+    def metrics_text(self) -> str:
+        """Prometheus 文本格式（各阶段耗时、处理量、缓存命中，以及总耗时和完成时间）"""
+        lines: list[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+        by_stage = [(f'{{stage="{st.name}"}}', st) for st in self.stages]
+        metric("thd_build_stage_seconds", "gauge", "各阶段耗时（秒）",
+               [(lb, st.seconds) for lb, st in by_stage])
+        metric("thd_build_stage_items", "gauge", "各阶段处理的项数（读取为行，注音为单元格）",
+               [(lb, st.count) for lb, st in by_stage])
+        metric("thd_build_stage_cache_hits", "gauge", "各阶段读音缓存命中次数",
+               [(lb, st.cache_hits) for lb, st in by_stage])
+        metric("thd_build_stage_cache_misses", "gauge", "各阶段读音缓存未命中次数",
+               [(lb, st.cache_misses) for lb, st in by_stage])
+        metric("thd_build_duration_seconds", "gauge", "整次构建耗时（秒）",
+               [("", time.perf_counter() - self.started)])
+        metric("thd_build_last_success_timestamp_seconds", "gauge", "上次构建完成的时间（Unix 时间戳）",
+               [("", time.time())])
+        return "\n".join(lines) + "\n"
+
+
+# ---------- 构建 API：build(source, config) -> BuildResult ----------
+class BuildError(Exception):
+    """构建无法进行（输入不存在、CSV 为空、缺少形码表等），消息可直接给用户看"""
+
+
+# 基本输出（--targets 可选的目标名 -> 输出路径）
+BUILD_TARGETS = {
+    "full": OUT_FULL,
+    "simp": OUT_SIMP,
+    "all": OUT_ALL,
+    "ms": OUT_MS,
+    "multiaccent": OUT_MULTI,
+    "nodup": OUT_NODUP,
+    "accent": OUT_ACCENT,
+}
+
+
+def parse_targets(value: str) -> frozenset[str]:
+    names = [x.strip().lower() for x in value.split(",") if x.strip()]
+    unknown = [x for x in names if x not in BUILD_TARGETS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"未知的输出目标：{', '.join(unknown)}（可选：{', '.join(BUILD_TARGETS)}）"
+        )
+    return frozenset(names)
+
+
+# 条目来源：(源序号, 行号, 列号) 压成一个 64 位整数，存在与输出行一一对应的 array("Q") 里
+# 行号为表格中的行（标题是第 1 行），列号从 0 数起
+_PROV_SOURCE_SHIFT = 48
+_PROV_ROW_SHIFT = 16
+_PROV_COL_MASK = (1 << _PROV_ROW_SHIFT) - 1
+_PROV_ROW_MASK = (1 << (_PROV_SOURCE_SHIFT - _PROV_ROW_SHIFT)) - 1
+
+
+def pack_provenance(source: int, row: int, col: int) -> int:
+    return (source << _PROV_SOURCE_SHIFT) | (row << _PROV_ROW_SHIFT) | col
+
+
+def unpack_provenance(p: int) -> tuple[int, int, int]:
+    return p >> _PROV_SOURCE_SHIFT, (p >> _PROV_ROW_SHIFT) & _PROV_ROW_MASK, p & _PROV_COL_MASK
+
+
+@dataclass
+class BuildConfig:
+    """一次构建的全部设置；默认值取自文件开头的配置区"""
+    weight: int = WEIGHT
+    min_len: int = MIN_LEN
+    out_dir: str | None = None  # 设置后所有输出改放到该目录（文件名不变）
+    targets: frozenset[str] = frozenset(BUILD_TARGETS)  # 要写出的基本输出，见 BUILD_TARGETS
+    columns: list[str] = field(default_factory=list)     # 只用这些列（见 resolve_columns），空表示全部
+    xlsx: list[str] = field(default_factory=list)        # 追加为额外列的 xlsx 工作簿
+    sources: list[str] = field(default_factory=list)     # 其它词表（优先级依次降低，都低于主表）
+    custom_pinyin: dict[str, str] | None = None       # None 表示用 CUSTOM_PINYIN
+    custom_word_pinyin: dict[str, str] | None = None  # None 表示用 CUSTOM_WORD_PINYIN
+    extra: str = extra
+    multi_expand: bool = MULTI_EXPAND
+    multi_expand_max: int = MULTI_EXPAND_MAX
+    fuzzy: bool = False
+    fuzzy_max: int = FUZZY_MAX
+    shuangpin: list[str] = field(default_factory=list)
+    shape: list[str] = field(default_factory=list)
+    romaji: bool = False
+    trad: bool = False
+    tones: bool = False
+    index: bool = False
+    explain: bool = False
+    sqlite: bool = False
+    corpus: list[str] = field(default_factory=list)  # 语料文件或目录，用来按出现次数定权重
+    jobs: int | None = None                          # 语料扫描等并行步骤的进程数（None 为 CPU 数）
+    polyphone_model: str | None = None               # main.py polyphone 训练出的多音字模型
+
+    def out(self, path: str) -> str:
+        if self.out_dir is None:
+            return path
+        return str(Path(self.out_dir) / Path(path).name)
+
+
+@dataclass
+class BuildResult:
+    files: dict[str, str | bytes]  # 输出路径 -> 内容（按写出顺序）
+    summary: list[str]             # 每个输出一行说明
+    stats: MultiCharStats | None   # 没有要求 accent/multiaccent/--multi-expand 时为 None
+    sources: list[str] = field(default_factory=list)  # 源序号 -> 源名称
+    # 输出路径 -> 每行的来源（pack_provenance），与文件开头的 len(array) 行一一对应
+    provenance: dict[str, array] = field(default_factory=dict)
+    warnings: list[str] = field(default_factory=list)  # 读音检查等发现的问题（不影响输出）
+    manifest: bool = False  # 写出时维护各目录的 manifest.json（只有词库构建的输出才要）
+
+    def write(self) -> list[str]:
+        """写出全部文件（见 write_outputs），返回内容有变化、真正重写了的路径"""
+        return write_outputs(self.files, self.manifest)
+
+
+def join_lines(lines: list[str]) -> str:
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+def header_name(name: str) -> str:
+    return name.strip().lstrip("\ufeff")
+
+
+def column_header(rows: list[list[str]], c: int) -> str:
+    """第 c 列的表头；数据行比表头宽时，多出来的列没有表头，返回空串"""
+    return header_name(rows[0][c]) if rows and c < len(rows[0]) else ""
+
+
+def resolve_columns(header: list[str], specs: list[str]) -> list[int]:
+    """
+    把列选择解析成列号（按给出的顺序，重复的只取一次）：
+    - "名称"：表头等于该名称的所有列（重复表头如 符卡名 会全部选中）
+    - "名称#k"：表头等于该名称的第 k 列（从 1 数起），用于区分重复的 符卡名
+    - "@i"：第 i 列（从 1 数起）
+    """
+    names = [header_name(h) for h in header]
+    cols: list[int] = []
+    for spec in specs:
+        if spec.startswith("@") and spec[1:].isdigit():
+            i = int(spec[1:]) - 1
+            if not 0 <= i < len(names):
+                raise BuildError(f"列号超出范围：{spec}（共 {len(names)} 列）")
+            found = [i]
+        else:
+            name, sep, k = spec.rpartition("#")
+            if not (sep and k.isdigit()):
+                name, k = spec, ""
+            found = [i for i, h in enumerate(names) if h == name]
+            if not found:
+                raise BuildError(f"表头中没有这一列：{name}")
+            if k:
+                if not 1 <= int(k) <= len(found):
+                    raise BuildError(f"{name} 只有 {len(found)} 列：{spec}")
+                found = [found[int(k) - 1]]
+        cols.extend(found)
+    return dedupe_keep_order(cols)
+
+
+def project_rows(rows: Iterable[list[str]], cols: list[int]) -> list[list[str]]:
+    return [[r[c] if c < len(r) else "" for c in cols] for r in rows]
+
+
+def _read_csv(path: str | Path, columns: list[str] | None = None) -> tuple[list[list[str]], list[int] | None]:
+    in_path = Path(path)
+    if not in_path.exists():
+        raise BuildError(f"找不到输入文件：{in_path.resolve()}")
+    with in_path.open("r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        if not columns:
+            return list(reader), None
+        header = next(reader, None)
+        if header is None:
+            return [], None
+        cols = resolve_columns(header, columns)
+        return project_rows([header], cols) + project_rows(reader, cols), cols
+
+
+def read_csv_rows(path: str | Path, columns: list[str] | None = None) -> list[list[str]]:
+    """读整个 CSV；给了 columns 时每行只保留选中的列（标题行也一样）"""
+    return _read_csv(path, columns)[0]
+
+
+def load_rows(
+    source: str | Path | Iterable[list[str]], config: BuildConfig, origins: list[tuple[str, int] | None] | None = None
+) -> tuple[list[list[str]], list[int] | None]:
+    """
+    读入源表（CSV 或 xlsx 路径，或现成的行），追加 config.xlsx 的列，再按 config.columns 取列。
+    返回 (行, 每列在原表中的列号)；没有取列时列号为 None（即原样）。
+
+    给了 origins 时，对来自 xlsx 的列填入每个原表列号的出处（见 column_origin），
+    让 --explain 等能指出单元格真正在哪个文件、哪一列。
+    """
+    if isinstance(source, (str, Path)):
+        if Path(source).suffix.lower() == ".xlsx":
+            rows, sheet_cols = read_xlsx_table(source)
+            if origins is not None:
+                origins[:] = sheet_cols
+        elif not config.xlsx:
+            return _read_csv(source, config.columns)  # 只选几列时边读边丢掉其它列
+        else:
+            rows = read_csv_rows(source)
+    else:
+        rows = list(source)
+    for path in config.xlsx:
+        extra, sheet_cols = read_xlsx_table(path)
+        if origins is not None:
+            width = max((len(r) for r in rows), default=0)
+            origins[len(origins):] = [None] * (width - len(origins))
+            origins.extend(sheet_cols)
+        rows = merge_columns(rows, extra)
+    if rows and config.columns:
+        cols = resolve_columns(rows[0], config.columns)
+        return project_rows(rows, cols), cols
+    return rows, None
+
+
+def column_origin(origins: list[tuple[str, int] | None], name: str, col: int) -> tuple[str, int]:
+    """原表第 col 列（provenance 里的列号）实际来自哪个文件的第几列；不是 xlsx 合并进来的列就是源表本身"""
+    hit = origins[col] if col < len(origins) else None
+    return hit if hit is not None else (name, col)
+
+
+def explain_groups(
+    outputs: list[tuple[str, list[str], array, array]],
+    tables: list[tuple[list[list[str]], list[int] | None]],
+    source_names: list[str],
+    origins: list[list[tuple[str, int] | None]],
+    resolver: PinyinResolver,
+    extra_text: str,
+) -> dict[bytes, list[dict]]:
+    """
+    把 (输出路径, 行, 来源数组, 规则数组) 展开成 --explain 索引的内容：键 -> 说明列表。
+    单元格原文、表头、自定义读音的具体取值都在这里查好存进索引，查询时不用再读源表。
+    """
+    groups: dict[bytes, list[dict]] = {}
+
+    def add(rec: dict) -> None:
+        for key in explain_keys(rec["text"], rec["code"]):
+            groups.setdefault(key, []).append(rec)
+
+    for path, lines, provs, hows in outputs:
+        for line, prov, how in zip(lines, provs, hows):
+            parsed = parse_dict_line(line)
+            if parsed is None:
+                continue
+            text, code, weight = parsed
+            sid, row, col = unpack_provenance(prov)
+            rows, cols = tables[sid]
+            c = cols.index(col) if cols is not None else col
+            cell = rows[row - 1][c].strip()
+            rule, origin, trad = unpack_how(how)
+            source_text = cell if rule == 0 else name_rule_source(cell, rule)
+            detail = ""
+            if origin == ORIGIN_WORD:
+                detail = f'"{source_text}" = "{resolver.custom_word_pinyin[source_text]}"'
+            elif origin == ORIGIN_CHAR:
+                detail = "、".join(
+                    f"{ch}={resolver.custom_pinyin[ch]}" for ch in dict.fromkeys(source_text)
+                    if ch in resolver.custom_pinyin
+                )
+            elif origin == ORIGIN_MODEL:
+                detail = "、".join(
+                    f"{ch}={reading}（{PolyphoneModel.describe(key)}，置信度 {conf:.2f}）"
+                    for ch, reading, conf, key in resolver.model_picks(source_text)
+                )
+            source, source_col = column_origin(origins[sid], source_names[sid], col)
+            add({
+                "text": text, "code": code, "weight": weight, "file": Path(path).name,
+                "source": source, "row": row, "col": source_col + 1,
+                "header": column_header(rows, c), "cell": cell,
+                "split": NAME_RULES[rule], "reading": ORIGIN_NAMES[origin], "detail": detail, "trad": trad,
+            })
+    for line in extra_text.strip().splitlines():
+        parsed = parse_dict_line(line)
+        if parsed is not None:
+            add({"text": parsed[0], "code": parsed[1], "weight": parsed[2], "file": "extra"})
+    return groups
+
+
+def build(
+    source: str | Path | Iterable[list[str]] = INPUT_CSV,
+    config: BuildConfig | None = None,
+    memo: dict | None = None,
+    progress: Progress | None = None,
+    source_name: str | None = None,
+) -> BuildResult:
+    """
+    构建一份词库，只返回结果，不写文件（调用 result.write() 才写）。
+
+    source 可以是 CSV 路径，也可以是已经读好的行（第一行为标题）；
+    传行时可用 source_name 给出它原来的文件名（--explain、--sqlite 里的来源名称），否则记为 <rows>。
+    每次调用的状态（多音字统计、去重集合等）都是局部的，可以在多个线程/进程里同时构建；
+    pypinyin 的查询缓存、形码表、简繁表在同一进程内的多次构建之间共享。
+    memo 见 PinyinResolver，同一份 config 的多次构建可以传同一个 dict。
+    progress 用来报告各阶段进度（见 Progress），不传时不报告。
+    """
+    config = config or BuildConfig()
+    progress = progress or Progress()
+    out = config.out
+    if config.romaji and config.columns:
+        raise BuildError("--romaji 按前三列（全名/姓/名）对照 thchars.csv，不能和 --columns 一起用")
+
+    shape_tables: dict[str, CharCodeTable] = {}
+    for name in config.shape:
+        table_path = Path(SHAPE_TABLES[name])
+        if not table_path.exists():
+            raise BuildError(f"找不到形码表（{name}）：{table_path.resolve()}")
+        shape_tables[name] = load_char_code_table(table_path)
+
+    progress.stage("read", "读取", unit="行", sample=1)
+    # origins：各词表中由 xlsx 合并进来的列的真实出处（见 column_origin）
+    origins: list[list[tuple[str, int] | None]] = [[] for _ in range(1 + len(config.sources))]
+    rows, col_ids = load_rows(source, config, origins[0])
+    if not rows:
+        raise BuildError("CSV 为空。")
+    progress.tick(len(rows) - 1)
+    # 其它词表不做 --xlsx 合并和 --columns 取列，按原样读入
+    tables = [(rows, col_ids)]
+    side_config = replace(config, columns=[], xlsx=[])
+    for sid, path in enumerate(config.sources, 1):
+        tables.append(load_rows(path, side_config, origins[sid]))
+        progress.tick(max(len(tables[-1][0]) - 1, 0))
+    progress.done()
+    if source_name is None:
+        source_name = str(source) if isinstance(source, (str, Path)) else "<rows>"
+    source_names = [source_name] + [str(p) for p in config.sources]
+
+    # 只计算要写出的东西需要的部分：
+    # 多音字统计只给 accent/multiaccent 和 --multi-expand 排序用；nodup 只给 nodup 和形码用
+    targets = config.targets
+    need_full = bool(targets & {"full", "all", "ms"}) or config.index or bool(
+        config.fuzzy or config.shuangpin or config.tones or config.sqlite
+    )
+    need_simp = bool(targets & {"simp", "all", "ms"}) or config.index
+    need_multi = "multiaccent" in targets
+    need_nodup = "nodup" in targets or bool(shape_tables)
+    need_stats = need_multi or "accent" in targets or (need_full and config.multi_expand)
+    need_readings = need_full or need_simp or need_stats
+
+    model = None
+    if config.polyphone_model:
+        if not Path(config.polyphone_model).exists():
+            raise BuildError(f"找不到多音字模型：{Path(config.polyphone_model).resolve()}（先运行 main.py polyphone）")
+        model = load_polyphone_model(config.polyphone_model)
+
+    stats = MultiCharStats() if need_stats else None
+    resolver = PinyinResolver(config.custom_pinyin, config.custom_word_pinyin, stats, memo, model)
+    weight = config.weight
+
+    data_rows = rows[1:]  # 跳过标题
+    s2t = build_s2t_converter() if config.trad and need_full else None
+
+    romaji_lines: list[str] = []
+    if config.romaji:
+        # 按编码排序输出；部分罗马字（前缀）查询交给 --index 生成的候选索引
+        pairs = sorted({(code, text) for text, code in romaji_join(data_rows, load_romaji_map(ROMAJI_CSV))})
+        romaji_lines = [format_rime_line(text, code, ROMAJI_WEIGHT) for code, text in pairs]
+
+    # 按列收集并列内去重（保留第一次出现的位置），各词表按优先级依次排在后面
+    cols: list[list[tuple[str, int]]] = []
+    for sid, (table_rows, table_cols) in enumerate(tables):
+        body = table_rows[1:]
+        for c in range(max((len(r) for r in body), default=0)):
+            orig_col = table_cols[c] if table_cols is not None else c
+            col_items: dict[str, int] = {}
+            for i, r in enumerate(body):
+                if c < len(r):
+                    v = r[c].strip()
+                    if v and v not in col_items:
+                        col_items[v] = pack_provenance(sid, i + 2, orig_col)
+            cols.append(list(col_items.items()))
+
+    full_lines: list[str] = []
+    simp_lines: list[str] = []
+    multi_lines: list[str] = []
+    full_prov = array("Q")
+    simp_prov = array("Q")
+    full_how = array("B")  # 每行的 pack_how，与 full_prov 一一对应（只在 --explain 时有意义）
+    simp_how = array("B")
+    need_how = config.explain
+
+    # 多个词表时，一个词由最先给出它的（优先级最高的）词表决定读音和权重
+    text_owner: dict[str, int] = {}
+    overridden = [0] * len(tables)
+
+    nodup_words: list[str] = []
     nodup_seen: set[str] = set()
 
     seen_full: set[tuple[str, str]] = set()
     seen_simp: set[tuple[str, str]] = set()
     seen_multi: set[tuple[str, str]] = set()
 
-    def emit_full(text: str, code_full: str, weight: int):
+    trad_count = 0
+
+    # 读音检查：自定义读音表整体查一遍，输出的每个 token 查音节表（不合法音节 -> 第一个出现它的词）
+    warnings = check_overrides(resolver.custom_pinyin, resolver.custom_word_pinyin)
+    bad_tokens: dict[str, str] = {}
+
+    # --multi-expand：含多音字的词先记下来，等统计完整后再展开
+    expand_pending: list[tuple[str, str, str, int, int]] = []
+
+    # 按音节 id 保存的全拼条目，供模糊音等按音节处理的输出使用
+    id_entries: list[tuple[str, tuple[int, ...]]] = []
+    need_ids = config.fuzzy or bool(config.shuangpin)
+    # 带读音记录的条目，供 --tones 使用
+    reading_entries: list[tuple[str, list[Reading]]] = []
+
+    def emit_full(
+        text: str, code_full: str, weight: int, prov: int, readings: list[Reading] | None = None, how: int = 0
+    ):
         k = (text, code_full)
         if k not in seen_full:
             seen_full.add(k)
             full_lines.append(format_rime_line(text, code_full, weight))
+            full_prov.append(prov)
+            full_how.append(how)
+            if readings is not None:
+                if need_ids:
+                    id_entries.append((text, intern_tokens(r.normal for r in readings)))
+                if config.tones:
+                    reading_entries.append((text, readings))
 
-    def emit_simp(text: str, code_simp: str, weight: int):
+    def emit_simp(text: str, code_simp: str, weight: int, prov: int, how: int = 0):
         k = (text, code_simp)
         if k not in seen_simp:
             seen_simp.add(k)
             simp_lines.append(format_rime_line(text, code_simp, weight))
+            simp_prov.append(prov)
+            simp_how.append(how)
 
     def emit_multi(text: str, code_full: str | None):
         k = (text, code_full or "")
@@ -1418,68 +4245,655 @@ def main() -> int:
             return
         seen_multi.add(k)
         if code_full:
-            multi_lines.append(format_rime_line(text, code_full, WEIGHT))
+            multi_lines.append(format_rime_line(text, code_full, weight))
         else:
             multi_lines.append(f"{text}{COL_SEP}<<<UNPARSED>>>")
 
+    # --corpus：先统计每个词在语料里的出现次数，换算成权重
+    text_weights: dict[str, int] = {}
+    if config.corpus and (need_full or need_simp):
+        words = dedupe_keep_order(d for col in cols for raw_word, _ in col for d, _ in expand_name_entries(raw_word))
+        counts, scanned = corpus_counts(words, config.corpus, config.jobs, progress)
+        text_weights = {w: tier_weight(n, weight) for w, n in zip(words, counts) if n}
+        summary_corpus = f"语料：扫描 {scanned / (1 << 20):.1f} MB，{len(text_weights)}/{len(words)} 个词出现过"
+    else:
+        summary_corpus = ""
+
+    progress.stage("resolve", "注音", sum(map(len, cols)), "单元格")
+    tick = progress.tick
     for col in cols:
-        for raw_word in col:
+        for raw_word, prov in col:
+            tick()
             entries = expand_name_entries(raw_word)
 
             # output_nodup：只输出 display_text（去重保序）
-            for display_text, _ in entries:
-                if display_text not in nodup_seen:
-                    nodup_seen.add(display_text)
-                    nodup_words.append(display_text)
+            if need_nodup:
+                for display_text, _ in entries:
+                    if display_text not in nodup_seen:
+                        nodup_seen.add(display_text)
+                        nodup_words.append(display_text)
 
+            if not need_readings:
+                continue
             for display_text, source_text in entries:
-                tokens, has_multi, has_unparsed = pinyin_tokens_for_text(source_text)
+                if len(tables) > 1:
+                    sid = prov >> _PROV_SOURCE_SHIFT
+                    if text_owner.setdefault(display_text, sid) != sid:
+                        overridden[sid] += 1
+                        continue
+                readings, has_multi, has_unparsed = resolver.readings_for_text(source_text)
+                rule = name_rule(raw_word, display_text) if need_how else 0
+                how = pack_how(rule, resolver.reading_origin(source_text)) if need_how else 0
+                tokens = [r.normal for r in readings]
+                for t in tokens:
+                    if not is_legal_token(t):
+                        bad_tokens.setdefault(t, display_text)
                 code_full = " ".join(tokens).strip()
                 code_simp = "".join(t[0] for t in tokens if t).strip()
+                w = text_weights.get(display_text, weight)
 
-                if code_full:
-                    emit_full(display_text, code_full, WEIGHT)
-                if code_simp and len(code_simp) >= MIN_LEN:
-                    emit_simp(display_text, code_simp, WEIGHT)
+                if code_full and need_full:
+                    emit_full(display_text, code_full, w, prov, readings, how)
+                    if s2t is not None:
+                        trad = s2t.convert(display_text)
+                        if trad != display_text:
+                            trad_count += 1
+                            emit_full(trad, code_full, w, prov, readings, how | _HOW_TRAD)
+                if code_simp and need_simp and len(code_simp) >= config.min_len:
+                    emit_simp(display_text, code_simp, w, prov, how)
 
-                if has_multi or has_unparsed:
+                if need_multi and (has_multi or has_unparsed):
                     emit_multi(display_text, code_full if code_full else None)
+                if has_multi and code_full and need_full and config.multi_expand:
+                    expand_pending.append((display_text, source_text, code_full, prov, rule))
+
+    expand_count = 0
+    if expand_pending:
+        progress.stage("expand", "多音字展开", len(expand_pending), "词")
+    for display_text, source_text, code_full, prov, rule in expand_pending:
+        tick()
+        how = pack_how(rule, ORIGIN_EXPAND)
+        codes = resolver.multi_reading_codes(source_text, code_full, config.multi_expand_max)
+        for rank, code in enumerate(codes):
+            k = (display_text, code)
+            if k not in seen_full:
+                expand_count += 1
+            emit_full(display_text, code, multi_expand_weight(rank), prov, how=how)
+            if s2t is not None:
+                trad = s2t.convert(display_text)
+                if trad != display_text:
+                    emit_full(trad, code, multi_expand_weight(rank), prov, how=how | _HOW_TRAD)
+
+    progress.stage("render", "生成输出", unit="文件", sample=1)
+    fuzzy_lines: list[str] = []
+    if config.fuzzy:
+        seen_fuzzy: set[tuple[str, str]] = set(seen_full)
+        for text, ids in id_entries:
+            for code in fuzzy_codes(ids, config.fuzzy_max):
+                k = (text, code)
+                if k not in seen_fuzzy:
+                    seen_fuzzy.add(k)
+                    fuzzy_lines.append(format_rime_line(text, code, FUZZY_WEIGHT))
+
+    # 带声调：读音记录在主循环里已经得到，这里只是换个字段拼接
+    tone_lines: dict[str, list[str]] = {}
+    if config.tones:
+        for path, attr in ((OUT_TONE3, "tone3"), (OUT_TONEMARK, "tone"), (OUT_ZHUYIN, "zhuyin")):
+            seen_tone: set[tuple[str, str]] = set()
+            lines = tone_lines.setdefault(out(path), [])
+            for text, readings in reading_entries:
+                code = " ".join(getattr(r, attr) for r in readings)
+                k = (text, code)
+                if k not in seen_tone:
+                    seen_tone.add(k)
+                    lines.append(format_rime_line(text, code, weight))
+
+    # 双拼：先为每个方案生成按音节 id 下标的表，再一次遍历所有条目
+    sp_tables = {name: shuangpin_table(SHUANGPIN_SCHEMES[name]) for name in config.shuangpin}
+    sp_lines: dict[str, list[str]] = {name: [] for name in config.shuangpin}
+    sp_seen: dict[str, set[tuple[str, str]]] = {name: set() for name in config.shuangpin}
+    if sp_tables:
+        for text, ids in id_entries:
+            for name, table in sp_tables.items():
+                code = " ".join(table[i] for i in ids)
+                k = (text, code)
+                if k not in sp_seen[name]:
+                    sp_seen[name].add(k)
+                    sp_lines[name].append(format_rime_line(text, code, SHUANGPIN_WEIGHT))
 
-    # 写 output_full/simp/all
-    Path(OUT_FULL).write_text("\n".join(full_lines) + ("\n" if full_lines else ""), encoding="utf-8")
-    Path(OUT_SIMP).write_text("\n".join(simp_lines) + ("\n" if simp_lines else ""), encoding="utf-8")
+    # 形码：只和字形有关，对去重后的显示文本逐个查表
+    shape_lines: dict[str, list[str]] = {}
+    shape_missing: dict[str, int] = {}
+    for name, table in shape_tables.items():
+        lines = shape_lines.setdefault(name, [])
+        missing = 0
+        for text in nodup_words:
+            code = shape_word_code(text, table, SHAPE_RULES[name])
+            if code:
+                lines.append(format_rime_line(text, code, SHAPE_WEIGHT))
+            else:
+                missing += 1
+        shape_missing[name] = missing
+
+    files: dict[str, str | bytes] = {}
+    summary: list[str] = []
+
+    provenance: dict[str, array] = {}
+
+    def emit(path: str, data: str | bytes, note: str) -> None:
+        """登记一个输出文件及其摘要行；每个输出报告一次进度"""
+        files[path] = data
+        summary.append(f"{path}: {note}")
+        progress.tick()
+
+    # output_full/simp/all
+    if "full" in targets:
+        provenance[out(OUT_FULL)] = full_prov
+        emit(
+            out(OUT_FULL), join_lines(full_lines),
+            f"{len(full_lines)} 行"
+            + (f"（其中多音字展开 {expand_count} 行）" if config.multi_expand else "")
+            + (f"（含繁体写法 {trad_count} 个）" if config.trad else ""),
+        )
+    if "simp" in targets:
+        provenance[out(OUT_SIMP)] = simp_prov
+        emit(out(OUT_SIMP), join_lines(simp_lines), f"{len(simp_lines)} 行 (MIN_LEN={config.min_len})")
 
     all_lines = full_lines + simp_lines
-    Path(OUT_ALL).write_text("\n".join(all_lines) + ("\n" if all_lines else "") + extra, encoding="utf-8")
+    if "all" in targets:
+        provenance[out(OUT_ALL)] = full_prov + simp_prov
+        emit(out(OUT_ALL), join_lines(all_lines) + config.extra, f"{len(all_lines)} 行")
 
     # output_ms：与 output_all 一致，但权重全部为 1
-    ms_lines = []
-    for line in all_lines:
-        parts = line.split(COL_SEP)
-        if len(parts) >= 3:
-            parts[-1] = "1"
-            ms_lines.append(COL_SEP.join(parts))
-        elif len(parts) == 2:
-            ms_lines.append(line + COL_SEP + "1")
+    if "ms" in targets:
+        ms_lines = []
+        for line in all_lines:
+            parts = line.split(COL_SEP)
+            if len(parts) >= 3:
+                parts[-1] = "1"
+                ms_lines.append(COL_SEP.join(parts))
+            elif len(parts) == 2:
+                ms_lines.append(line + COL_SEP + "1")
+            else:
+                ms_lines.append(line)
+        emit(out(OUT_MS), join_lines(ms_lines), f"{len(ms_lines)} 行（权重全部为 1）")
+
+    if "multiaccent" in targets:
+        emit(out(OUT_MULTI), join_lines(multi_lines), f"{len(multi_lines)} 行")
+    if "nodup" in targets:
+        emit(out(OUT_NODUP), join_lines(nodup_words), f"{len(nodup_words)} 行")
+
+    if "accent" in targets and stats is not None:
+        acc_lines = stats.accent_lines()
+        emit(out(OUT_ACCENT), join_lines(acc_lines), f"{len(acc_lines)} 行（多音字单字；读音按出现次数排序）")
+
+    if config.fuzzy:
+        emit(out(OUT_FUZZY), join_lines(fuzzy_lines), f"{len(fuzzy_lines)} 行（每词最多 {config.fuzzy_max} 种）")
+    for name, lines in sp_lines.items():
+        emit(out(OUT_SHUANGPIN.format(name)), join_lines(lines), f"{len(lines)} 行")
+    for path, lines in tone_lines.items():
+        emit(path, join_lines(lines), f"{len(lines)} 行")
+    for name, lines in shape_lines.items():
+        emit(
+            out(OUT_SHAPE.format(name)), join_lines(lines), f"{len(lines)} 行（{shape_missing[name]} 个词含表外字，已跳过）"
+        )
+    if config.romaji:
+        emit(out(OUT_ROMAJI), join_lines(romaji_lines), f"{len(romaji_lines)} 行")
+
+    if config.index:
+        index_lines = all_lines + romaji_lines + config.extra.strip().splitlines()
+        data, index_count = candidate_index_bytes(filter(None, map(parse_dict_line, index_lines)))
+        emit(out(OUT_INDEX), data, f"{index_count} 条")
+
+    if config.sqlite:
+        data, db_count = sqlite_bytes(sqlite_rows(full_lines, full_prov, tables, source_names, origins, config.extra))
+        emit(out(OUT_SQLITE), data, f"{db_count} 条")
+
+    if config.explain:
+        groups = explain_groups(
+            [(out(OUT_FULL), full_lines, full_prov, full_how), (out(OUT_SIMP), simp_lines, simp_prov, simp_how)],
+            tables, source_names, origins, resolver, config.extra,
+        )
+        emit(out(OUT_EXPLAIN), explain_index_bytes(groups), f"{len(groups)} 个键")
+
+    if summary_corpus:
+        summary.append(summary_corpus)
+    for sid in range(1, len(tables)):
+        summary.append(f"{source_names[sid]}: {overridden[sid]} 个词已由优先级更高的词表给出，未采用")
+
+    for t, text in bad_tokens.items():
+        warnings.append(f"输出含不合法的音节 {t}（如 {text}）")
+    progress.done()
+
+    return BuildResult(files, summary, stats, source_names, provenance, warnings, manifest=True)
+
+
+# ---------- 分类词库（--shards） ----------
+def shard_of_header(name: str) -> str:
+    for shard, prefixes in SHARD_RULES:
+        if name.startswith(prefixes):
+            return shard
+    return SHARD_DEFAULT
+
+
+def shard_columns(header: list[str]) -> dict[str, list[int]]:
+    """分类 -> 列号（分类按 SHARD_RULES 的顺序，SHARD_DEFAULT 最后）"""
+    cols: dict[str, list[int]] = {shard: [] for shard, _ in SHARD_RULES}
+    cols[SHARD_DEFAULT] = []
+    for i, name in enumerate(header):
+        cols[shard_of_header(header_name(name))].append(i)
+    return {shard: c for shard, c in cols.items() if c}
+
+
+def shard_dict_name(shard: str) -> str:
+    return f"{SHARD_DICT_NAME}.{shard}"
+
+
+def rime_dict_text(name: str, version: str, body: str, import_tables: list[str] | None = None) -> str:
+    head = [f"name: {name}", f'version: "{version}"', "sort: by_weight"]
+    if import_tables:
+        head.append("import_tables:")
+        head.extend(f"  - {t}" for t in import_tables)
+    head.append("...")
+    return "\n".join(head) + "\n" + body
+
+
+def shard_config(config: BuildConfig) -> BuildConfig:
+    """分类词库只需要 output_all 的正文（全拼 + 简拼），其余附加输出都关掉"""
+    return replace(
+        config, out_dir=None, targets=frozenset({"all"}), extra="", xlsx=[], sources=[],
+        fuzzy=False, shuangpin=[], shape=[], romaji=False, tones=False, index=False, explain=False, sqlite=False,
+    )
+
+
+# 不影响输出内容的设置：进程数只影响速度；文件类设置在 shard_inputs_hash 里按内容哈希
+SHARD_HASH_SKIP = {"out_dir", "jobs", "corpus", "polyphone_model"}
+
+
+def shard_inputs_hash(config: BuildConfig, script_hash: str) -> str:
+    """各分类共用的那部分内容哈希：本脚本、影响输出的设置、以及会读到的外部文件的内容"""
+    h = hashlib.sha256(script_hash.encode())
+    settings = [(f.name, getattr(config, f.name)) for f in fields(config) if f.name not in SHARD_HASH_SKIP]
+    h.update(repr(settings).encode("utf-8"))
+    paths: list[Path] = corpus_files(config.corpus) if config.corpus else []
+    if config.polyphone_model:
+        paths.append(Path(config.polyphone_model))
+    if config.trad:
+        paths += [Path(p) for p in (S2T_PHRASE_TABLE, S2T_CHAR_TABLE, ROMAJI_CSV) if Path(p).exists()]
+    for p in paths:
+        h.update(file_sha256(p).encode())
+    return h.hexdigest()
+
+
+def shard_hash(rows: list[list[str]], inputs_hash: str) -> str:
+    h = hashlib.sha256(inputs_hash.encode())
+    for r in rows:
+        h.update("\x1f".join(r).encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def build_shard_body(rows: list[list[str]], config: BuildConfig) -> str:
+    result = build(rows, config)
+    return result.files[OUT_ALL]
+
+
+def build_shards(
+    source: str | Path = INPUT_CSV,
+    config: BuildConfig | None = None,
+    disabled: set[str] | None = None,
+    jobs: int | None = None,
+    progress: Progress | None = None,
+) -> BuildResult:
+    """
+    按 SHARD_RULES 把列分组，每组单独构建一个 Rime 词库，并生成引用它们的总词库。
+
+    各分类在多个进程里并行构建；内容哈希（该组的列 + 配置 + 本脚本）和上次一样、
+    且输出文件还在的分类直接跳过。disabled 中的分类既不构建也不被总词库引用。
+    工作进程不报告进度，由主进程在每个分类构建完时报告（progress）。
+    """
+    config = config or BuildConfig()
+    progress = progress or Progress()
+    disabled = SHARD_DISABLED if disabled is None else disabled
+    if config.columns or config.sources:
+        raise BuildError("--shards 按表头自动分组，不能和 --columns、--source 一起用")
+    progress.stage("read", "读取", unit="行", sample=1)
+    rows = read_csv_rows(source)
+    shards = shard_columns(rows[0]) if rows else {}
+    # xlsx 工作簿的列整体归入以文件名命名的分类（spells.xlsx -> spells）
+    for path in config.xlsx:
+        width = max((len(r) for r in rows), default=0)
+        extra_rows = read_xlsx_rows(path)
+        rows = merge_columns(rows, extra_rows)
+        extra_width = max((len(r) for r in extra_rows), default=0)
+        shards.setdefault(Path(path).stem, []).extend(range(width, width + extra_width))
+    if not rows:
+        raise BuildError("CSV 为空。")
+    progress.done(len(rows) - 1)
+
+    out_dir = Path(config.out_dir or SHARD_DIR)
+    state_path = out_dir / Path(SHARD_STATE).name
+    try:
+        old_state: dict[str, str] = json.loads(state_path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        old_state = {}
+
+    cfg = shard_config(config)
+    script_hash = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+    inputs_hash = shard_inputs_hash(cfg, script_hash)
+    shards = {s: c for s, c in shards.items() if s not in disabled}
+
+    state: dict[str, str] = {}
+    stale: dict[str, list[list[str]]] = {}
+    for shard, cols in shards.items():
+        shard_rows = project_rows(rows, cols)
+        state[shard] = shard_hash(shard_rows, inputs_hash)
+        path = out_dir / f"{shard_dict_name(shard)}.dict.yaml"
+        if old_state.get(shard) != state[shard] or not path.exists():
+            stale[shard] = shard_rows
+
+    files: dict[str, str | bytes] = {}
+    summary: list[str] = []
+    progress.stage("shards", "分类词库", len(stale), "个", sample=1)
+    bodies: dict[str, str] = {}
+    if stale:
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            futures = {ex.submit(build_shard_body, shard_rows, cfg): shard for shard, shard_rows in stale.items()}
+            for fut in as_completed(futures):
+                bodies[futures[fut]] = fut.result()
+                progress.tick()
+    progress.done()
+    for shard, cols in shards.items():
+        path = str(out_dir / f"{shard_dict_name(shard)}.dict.yaml")
+        if shard in bodies:
+            body = bodies[shard]
+            files[path] = rime_dict_text(shard_dict_name(shard), state[shard][:12], body)
+            summary.append(f"{path}: {len(body.splitlines())} 行（{len(cols)} 列）")
         else:
-            ms_lines.append(line)
-    Path(OUT_MS).write_text("\n".join(ms_lines) + ("\n" if ms_lines else ""), encoding="utf-8")
+            summary.append(f"{path}: 未变化，跳过")
+
+    master = str(out_dir / f"{SHARD_DICT_NAME}.dict.yaml")
+    master_version = hashlib.sha256("".join(state[s] for s in shards).encode()).hexdigest()[:12]
+    files[master] = rime_dict_text(
+        SHARD_DICT_NAME, master_version, config.extra.lstrip("\n"),
+        [shard_dict_name(s) for s in shards],
+    )
+    summary.append(f"{master}: 引用 {len(shards)} 个分类（{', '.join(shards)}）")
+    # 被跳过的分类保留旧哈希，重新启用时若没变化仍可跳过
+    files[str(state_path)] = json.dumps({**old_state, **state}, ensure_ascii=False, indent=2) + "\n"
+    return BuildResult(files, summary, None, manifest=True)
+
+
+def parse_shard_names(value: str) -> set[str]:
+    known = [s for s, _ in SHARD_RULES] + [SHARD_DEFAULT]
+    names = {x.strip() for x in value.split(",") if x.strip()}
+    unknown = sorted(names - set(known))
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知的分类：{', '.join(unknown)}（可选：{', '.join(known)}）")
+    return names
+
+
+# ---------- 监视模式（--watch） ----------
+def diff_cells(old: list[list[str]], new: list[list[str]]) -> list[tuple[int, int, str, str]]:
+    """逐格比较两份表，返回 [(行, 列, 旧值, 新值), ...]（行列从 1 数起）；相同的行整行跳过"""
+    changed: list[tuple[int, int, str, str]] = []
+    for r in range(max(len(old), len(new))):
+        a = old[r] if r < len(old) else []
+        b = new[r] if r < len(new) else []
+        if a == b:
+            continue
+        for c in range(max(len(a), len(b))):
+            x = a[c] if c < len(a) else ""
+            y = b[c] if c < len(b) else ""
+            if x != y:
+                changed.append((r + 1, c + 1, x, y))
+    return changed
+
+
+def line_diff(old: str | bytes | None, new: str | bytes) -> str:
+    if isinstance(new, bytes) or not isinstance(old, str):
+        return "已更新"
+    a, b = set(old.splitlines()), set(new.splitlines())
+    return f"+{len(b - a)} -{len(a - b)} 行"
+
+
+class WatchMemo(dict):
+    """--watch 用的解析缓存：记下本次构建查过的文本，构建完 prune 掉没再用到的（已删改的单元格）"""
+
+    def __init__(self):
+        super().__init__()
+        self.used: set[str] = set()
+
+    def get(self, key, default=None):
+        self.used.add(key)
+        return super().get(key, default)
+
+    def prune(self) -> None:
+        for key in self.keys() - self.used:
+            del self[key]
+        self.used.clear()
+
+
+def watch(source: str | Path, config: BuildConfig, interval: float = WATCH_INTERVAL) -> int:
+    """
+    常驻监视输入文件：pypinyin 和各种表只加载一次，文本解析结果跨构建缓存（WatchMemo），
+    没改动的单元格不再重新注音；主表每次只读一遍，比较和构建共用；
+    构建后只重写内容有变化的输出文件。Ctrl+C 退出。
+    """
+    paths = [Path(source), *map(Path, config.xlsx), *map(Path, config.sources)]
+    main_config = replace(config, columns=[], xlsx=[])
+    # xlsx 主表的列出处要在 build 里按路径读才有，只有 CSV 主表复用读好的行
+    reuse_rows = Path(source).suffix.lower() != ".xlsx"
+    memo = WatchMemo()
+    written: dict[str, str | bytes] = {}
+    versions: list[int] | None = None
+    rows_before: list[list[str]] | None = None
+    print(f"监视中：{', '.join(map(str, paths))}（Ctrl+C 退出）", file=sys.stderr)
+    try:
+        while True:
+            now = [file_version(p) for p in paths]
+            if now != versions:
+                others_changed = versions is not None and now[1:] != versions[1:]
+                versions = now
+                t0 = time.perf_counter()
+                try:
+                    rows, _ = load_rows(source, main_config)
+                    changed = diff_cells(rows_before, rows) if rows_before is not None else []
+                    if rows_before is not None and not changed and not others_changed:
+                        time.sleep(interval)
+                        continue  # 只是保存了一下，内容没变
+                    rows_before = rows
+                    result = build(rows if reuse_rows else source, config, memo, source_name=str(source))
+                except BuildError as e:
+                    print(e, file=sys.stderr)
+                    memo.used.clear()
+                    time.sleep(interval)
+                    continue
+                memo.prune()
+                updated = {p: c for p, c in result.files.items() if written.get(p) != c}
+                report = [f"- {p}: {line_diff(written.get(p), c)}" for p, c in updated.items()]
+                BuildResult(updated, [], None, manifest=True).write()
+                written.update(updated)
+                what = f"{len(changed)} 个单元格有变化" if changed or others_changed else "首次构建"
+                print(
+                    f"[{time.strftime('%H:%M:%S')}] {what}，"
+                    f"重写 {len(updated)} 个文件（{time.perf_counter() - t0:.2f} 秒）",
+                    file=sys.stderr,
+                )
+                for r, c, x, y in changed[:5]:
+                    print(f"  第 {r} 行 第 {c} 列：{x!r} -> {y!r}", file=sys.stderr)
+                for line in report:
+                    print("  " + line, file=sys.stderr)
+                for line in result.warnings:
+                    print(f"  警告：{line}", file=sys.stderr)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+# ---------- 命令行 ----------
+def parse_args(argv: list[str] | None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(
+        description="将 thd.csv 词库转换为带拼音的词库文本",
+        epilog="其它子命令：" + "、".join(f"main.py {name}" for name in COMMANDS),
+    )
+    ap.add_argument(
+        "--targets", type=parse_targets, default=frozenset(BUILD_TARGETS), metavar="目标[,目标...]",
+        help=f"只生成这些基本输出（默认全部），可选：{', '.join(BUILD_TARGETS)}",
+    )
+    ap.add_argument(
+        "--columns", type=lambda v: [x.strip() for x in v.split(",") if x.strip()], default=[],
+        metavar="列[,列...]",
+        help="只读取这些列：表头名（重复的表头全选）、表头名#k（第 k 个同名列）或 @i（第 i 列）",
+    )
+    ap.add_argument(
+        "--xlsx", action="append", default=[], metavar="工作簿.xlsx",
+        help="把 xlsx 工作簿的列追加到 thd.csv 后面一起构建（可重复；需要 openpyxl）",
+    )
+    ap.add_argument(
+        "--corpus", action="append", default=[], metavar="目录或文件",
+        help=f"按词在本地语料中的出现次数定权重（可重复；目录下读取 {CORPUS_GLOB}）",
+    )
+    ap.add_argument(
+        "--polyphone-model", default=None, metavar="模型.json",
+        help=f"多音字按邻字改用 main.py polyphone 从语料学到的读音（默认模型位置 {POLYPHONE_MODEL}）",
+    )
+    ap.add_argument(
+        "--progress", action="store_true",
+        help=f"在 stderr 报告各阶段进度：速度、缓存命中率、剩余时间（最多每 {PROGRESS_INTERVAL:g} 秒一行）",
+    )
+    ap.add_argument(
+        "--metrics", nargs="?", const=OUT_METRICS, default=None, metavar="文件",
+        help=f"构建完写出 Prometheus 文本格式的耗时与吞吐量指标（默认 {OUT_METRICS}）",
+    )
+    ap.add_argument(
+        "--watch", action="store_true",
+        help="常驻监视输入文件，有改动就增量重新构建（只重写有变化的输出）",
+    )
+    ap.add_argument(
+        "--explain", action="store_true",
+        help=f"额外生成来源说明索引 {OUT_EXPLAIN}（供 main.py explain 使用）",
+    )
+    ap.add_argument(
+        "--source", action="append", default=[], dest="sources", metavar="词表.csv",
+        help=f"和 {INPUT_CSV} 合并的其它词表（CSV 或 xlsx，可重复；越靠前优先级越高，都低于 {INPUT_CSV}）",
+    )
+    ap.add_argument(
+        "--shards", action="store_true",
+        help=f"改为按表头分类输出 Rime 词库到 {SHARD_DIR}（每类一个，外加 import_tables 总词库）",
+    )
+    ap.add_argument(
+        "--skip-shards", type=parse_shard_names, default=SHARD_DISABLED, metavar="分类[,分类...]",
+        help="--shards 时不生成这些分类，例如 spells",
+    )
+    ap.add_argument(
+        "--jobs", type=int, default=None, metavar="N",
+        help="并行步骤（--shards 的分类、--corpus 的语料分块）最多用 N 个进程（默认等于 CPU 数）",
+    )
+    ap.add_argument(
+        "--multi-expand", action="store_true", default=MULTI_EXPAND,
+        help="对含多音字的词额外输出其它读音组合（权重较低）",
+    )
+    ap.add_argument(
+        "--multi-expand-max", type=int, default=MULTI_EXPAND_MAX, metavar="N",
+        help=f"每个词最多额外输出 N 种读音组合（默认 {MULTI_EXPAND_MAX}）",
+    )
+    ap.add_argument(
+        "--fuzzy", action="store_true",
+        help=f"额外输出模糊音词库 {OUT_FUZZY}",
+    )
+    ap.add_argument(
+        "--fuzzy-max", type=int, default=FUZZY_MAX, metavar="N",
+        help=f"每个词最多输出 N 种模糊音变体（默认 {FUZZY_MAX}）",
+    )
+    ap.add_argument(
+        "--shuangpin", type=parse_shuangpin_schemes, default=[], metavar="方案[,方案...]",
+        help=f"额外输出双拼词库，可选：{', '.join(SHUANGPIN_SCHEMES)}, all",
+    )
+    ap.add_argument(
+        "--shape", type=parse_shape_schemes, default=[], metavar="方案[,方案...]",
+        help=f"额外输出形码词库（需要本地单字编码表），可选：{', '.join(SHAPE_TABLES)}",
+    )
+    ap.add_argument(
+        "--romaji", action="store_true",
+        help=f"额外输出罗马字编码词库 {OUT_ROMAJI}（数据来自 {ROMAJI_CSV}；同时用 --index 时一并写入候选索引）",
+    )
+    ap.add_argument(
+        "--trad", action="store_true",
+        help="每个词额外输出繁体写法（编码相同），写入 output_full/all/ms",
+    )
+    ap.add_argument(
+        "--tones", action="store_true",
+        help=f"额外输出带声调的词库：{OUT_TONE3}、{OUT_TONEMARK}、{OUT_ZHUYIN}",
+    )
+    ap.add_argument(
+        "--index", action="store_true",
+        help=f"额外生成候选查询索引 {OUT_INDEX}（供 main.py lookup/serve/bench 使用）",
+    )
+    ap.add_argument(
+        "--sqlite", action="store_true",
+        help=f"额外导出 SQLite 数据库 {OUT_SQLITE}（entries 表按词/全拼/简拼/分类建索引，entries_fts 做子串搜索）",
+    )
+    return ap.parse_args(argv)
 
-    Path(OUT_MULTI).write_text("\n".join(multi_lines) + ("\n" if multi_lines else ""), encoding="utf-8")
-    Path(OUT_NODUP).write_text("\n".join(nodup_words) + ("\n" if nodup_words else ""), encoding="utf-8")
 
-    acc_lines = accent_lines_sorted()
-    Path(OUT_ACCENT).write_text("\n".join(acc_lines) + ("\n" if acc_lines else ""), encoding="utf-8")
+def config_from_args(args: argparse.Namespace) -> BuildConfig:
+    return BuildConfig(
+        targets=args.targets,
+        columns=args.columns,
+        xlsx=args.xlsx,
+        sources=args.sources,
+        multi_expand=args.multi_expand,
+        multi_expand_max=args.multi_expand_max,
+        fuzzy=args.fuzzy,
+        fuzzy_max=args.fuzzy_max,
+        shuangpin=args.shuangpin,
+        shape=args.shape,
+        romaji=args.romaji,
+        trad=args.trad,
+        tones=args.tones,
+        index=args.index,
+        sqlite=args.sqlite,
+        explain=args.explain,
+        corpus=args.corpus,
+        jobs=args.jobs,
+        polyphone_model=args.polyphone_model,
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    args = parse_args(argv)
+    if args.watch:
+        if args.shards:
+            print("--watch 暂不支持 --shards", file=sys.stderr)
+            return 1
+        return watch(INPUT_CSV, config_from_args(args))
+
+    progress = Progress(sys.stderr if args.progress else None)
+    try:
+        if args.shards:
+            result = build_shards(INPUT_CSV, config_from_args(args), args.skip_shards, args.jobs, progress)
+        else:
+            result = build(INPUT_CSV, config_from_args(args), progress=progress)
+    except BuildError as e:
+        print(e, file=sys.stderr)
+        return 1
+    progress.stage("write", "写出", unit="文件")
+    written = set(result.write())
+    progress.done(len(written))
+    if args.metrics:
+        write_outputs({args.metrics: progress.metrics_text().encode("utf-8")})
 
+    for line in result.warnings:
+        print(f"警告：{line}", file=sys.stderr)
     print(
         "完成输出：\n"
-        f"- {OUT_FULL}: {len(full_lines)} 行\n"
-        f"- {OUT_SIMP}: {len(simp_lines)} 行 (MIN_LEN={MIN_LEN})\n"
-        f"- {OUT_ALL}: {len(all_lines)} 行\n"
-        f"- {OUT_MS}: {len(ms_lines)} 行（权重全部为 1）\n"
-        f"- {OUT_MULTI}: {len(multi_lines)} 行\n"
-        f"- {OUT_NODUP}: {len(nodup_words)} 行\n"
-        f"- {OUT_ACCENT}: {len(acc_lines)} 行（多音字单字；读音按出现次数排序）\n"
+        + "".join(f"- {line}\n" for line in result.summary)
+        + f"（重写 {len(written)} 个文件，{len(result.files) - len(written)} 个内容未变）\n"
     )
     return 0
 
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# main.py 是仓库根目录下的单个脚本，不是安装的包
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
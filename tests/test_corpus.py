@@ -0,0 +1,20 @@
+import pytest
+
+import main
+
+
+def naive_count(text: str, word: str) -> int:
+    return sum(text.startswith(word, i) for i in range(len(text)))
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_corpus_counts_across_chunk_boundaries(tmp_path, monkeypatch, jobs):
+    # 块很小时大多数词都会跨块，每个词仍应只算一次（包括互相包含、重叠出现的词）
+    monkeypatch.setattr(main, "CORPUS_CHUNK", 7)
+    text = "灵梦和魔理沙，灵梦灵梦。博丽灵梦在神社，魔理沙abc沙沙沙\n" * 5
+    (tmp_path / "a.txt").write_text(text, encoding="utf-8")
+    words = ["灵梦", "博丽灵梦", "魔理沙", "沙沙", "神社", "咲夜"]
+    counts, scanned = main.corpus_counts(words, [str(tmp_path)], jobs=jobs)
+    assert counts == [naive_count(text, w) for w in words]
+    assert scanned == len(text.encode("utf-8"))
+
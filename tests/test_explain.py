@@ -0,0 +1,45 @@
+import pytest
+
+import main
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / main.INPUT_CSV).write_text("人物,符卡\n灵梦,梦符\n", encoding="utf-8")
+    return tmp_path
+
+
+def explain(capsys, query: str) -> str:
+    capsys.readouterr()
+    assert main.main(["explain", query]) == 0
+    return capsys.readouterr().out
+
+
+def test_explain_names_xlsx_cell(workdir, capsys):
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "符卡"
+    for row in (["备注", "符卡名"], ["", "恋符"], ["", "魔符"]):
+        ws.append(row)
+    wb.save(workdir / "w.xlsx")
+
+    assert main.main(["--xlsx", "w.xlsx", "--explain", "--targets", "full"]) == 0
+    out = explain(capsys, "魔符")
+    assert "来源：w.xlsx 工作表 符卡 第 3 行 第 2 列（符卡名）：魔符" in out
+    out = explain(capsys, "梦符")
+    assert f"来源：{main.INPUT_CSV} 第 2 行 第 2 列（符卡）：梦符" in out
+
+
+def test_explain_row_wider_than_header(workdir, capsys):
+    (workdir / "short.csv").write_text("h1\na,b,c\n", encoding="utf-8")
+
+    assert main.main(["--source", "short.csv", "--explain", "--targets", "full"]) == 0
+    out = explain(capsys, "c")
+    assert "来源：short.csv 第 2 行 第 3 列（无表头）：c" in out
+
+
+def test_explain_without_index(workdir, capsys):
+    assert main.main(["explain", "梦符"]) == 1
+    assert "--explain" in capsys.readouterr().err
@@ -0,0 +1,16 @@
+import main
+
+
+def variants(syllable: str) -> list[str]:
+    return [main._SYLLABLES[v] for _, v in main.fuzzy_variants(main.syllable_id(syllable))]
+
+
+def test_fuzzy_variants_are_legal():
+    assert variants("dian") == []  # diang 不是普通话音节
+    assert variants("lian") == ["nian", "liang", "niang"]
+    assert all(main.is_legal_token(v) for s in ("zhan", "sen", "nuan", "xian") for v in variants(s))
+
+
+def test_fuzzy_codes_skip_illegal_syllables():
+    ids = main.intern_tokens(["dian", "zhan"])
+    assert main.fuzzy_codes(ids, 2) == ["dian zhang", "dian zan"]
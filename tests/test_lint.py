@@ -0,0 +1,23 @@
+import main
+
+
+def pairs(texts):
+    return {(a, b, kind) for a, b, kind in main.near_duplicate_pairs(texts)}
+
+
+def test_near_duplicate_pairs():
+    found = pairs(["魔理沙", "魔里沙", "雾雨魔理沙", "雾魔理沙", "灵符", "梦符", "博丽神社"])
+    assert ("魔理沙", "魔里沙", "sub") in found
+    assert ("雾雨魔理沙", "雾魔理沙", "indel") in found
+    assert ("雾魔理沙", "魔理沙", "indel") in found
+    assert not any({"灵符", "梦符"} == {a, b} for a, b, _ in found)  # 两字词差一字是正常的
+    assert not any("博丽神社" in (a, b) for a, b, _ in found)
+
+
+def test_near_duplicate_pairs_skips_patterns(monkeypatch):
+    monkeypatch.setattr(main, "LINT_BUCKET_MAX", 3)
+    grades = [f"符卡·{g}级" for g in "上中下难极"]
+    assert pairs(grades) == set()
+    assert pairs(grades[:3]) == {
+        ("符卡·上级", "符卡·下级", "sub"), ("符卡·上级", "符卡·中级", "sub"), ("符卡·下级", "符卡·中级", "sub"),
+    }
@@ -0,0 +1,34 @@
+import random
+
+import main
+
+
+def brute_force(entries, query, limit):
+    key = main.lookup_key(query)
+    items = sorted({(main.lookup_key(c), -w, t, c) for t, c, w in entries})
+    exact = [(t, c, -nw) for k, nw, t, c in items if k == key]
+    prefix = [(t, c, -nw) for k, nw, t, c in items if k.startswith(key) and k != key]
+    prefix.sort(key=lambda x: -x[2])  # 稳定排序：同权重保持键序
+    return (exact + prefix)[:limit]
+
+
+def test_prefix_lookup_is_top_by_weight(tmp_path):
+    rng = random.Random(0)
+    entries = [(f"词{i}", "ling " + "".join(rng.choice("abc") for _ in range(rng.randint(1, 6))), rng.randint(1, 5000))
+               for i in range(3000)]
+    entries.append(("灵", "ling", 10))
+    data, _ = main.candidate_index_bytes(entries)
+    path = tmp_path / "lookup.idx"
+    path.write_bytes(data)
+    idx = main.CandidateIndex(path)
+    try:
+        for query in ("ling", "linga", "lingab", "lingcc", "l", "lingcbacba", "x"):
+            for limit in (1, 10, 100):
+                assert idx.lookup(query, limit) == brute_force(entries, query, limit), (query, limit)
+    finally:
+        idx.close()
+
+
+def test_lookup_without_index(tmp_path, capsys):
+    assert main.main(["lookup", "--index", str(tmp_path / "missing.idx"), "ling"]) == 1
+    assert "--index" in capsys.readouterr().err
@@ -0,0 +1,16 @@
+import main
+
+
+def expand(word: str) -> list[str]:
+    config = main.BuildConfig(
+        custom_pinyin={}, custom_word_pinyin={}, multi_expand=True, targets=frozenset({"full"})
+    )
+    lines = main.build([["词"], [word]], config).files[main.OUT_FULL].splitlines()
+    return [line.split(main.COL_SEP)[1] for line in lines]
+
+
+def test_expansions_need_evidence():
+    codes = expand("东方传")
+    assert "dong fang zhuan" in codes
+    assert "dong pang chuan" not in codes
+    assert "dong wang chuan" not in codes
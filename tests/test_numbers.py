@@ -0,0 +1,29 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("digits, chars", [
+    ("0", "零"),
+    ("10", "十"),
+    ("15", "十五"),
+    ("110", "一百一十"),
+    ("101", "一百零一"),
+    ("1005", "一千零五"),
+    ("1050", "一千零五十"),
+    ("2003", "二千零三"),
+    ("10005", "一万零五"),
+    ("11005", "一万一千零五"),
+    ("100010", "十万零一十"),
+    ("100001000", "一亿零一千"),
+    ("7.5", "七点五"),
+    ("0721", "零七二一"),
+])
+def test_number_chars(digits, chars):
+    assert main.number_chars(digits) == chars
+
+
+def test_number_chars_liang():
+    assert main.number_chars("2003", liang=True) == "两千零三"
+    assert main.number_chars("120000", liang=True) == "十二万"
+    assert main.number_chars("2", liang=True, before_measure=True) == "两"
@@ -0,0 +1,30 @@
+import hashlib
+import json
+
+import main
+
+
+def test_build_writes_manifest_into_out_dir(tmp_path):
+    out_dir = tmp_path / "out"
+    config = main.BuildConfig(out_dir=str(out_dir), targets=frozenset({"full", "simp", "all"}))
+    result = main.build([["人物", "符卡"], ["灵梦", "梦符"], ["魔理沙", "恋符"]], config)
+    assert len(result.write()) == 3
+
+    manifest = json.loads((out_dir / main.OUT_MANIFEST_NAME).read_text(encoding="utf-8"))
+    assert set(manifest) == {p.name for p in map(main.Path, result.files)}
+    for name, entry in manifest.items():
+        data = (out_dir / name).read_bytes()
+        assert entry["sha256"] == hashlib.sha256(data).hexdigest()
+        assert entry["size"] == len(data)
+    assert not list(out_dir.glob("*.tmp"))  # 原子写出不留临时文件
+
+    assert result.write() == []  # 内容没变：一个都不重写
+    full = out_dir / main.Path(main.OUT_FULL).name
+    full.write_text("外部改过\n", encoding="utf-8")
+    assert result.write() == [str(full)]
+
+
+def test_plain_write_has_no_manifest(tmp_path):
+    main.write_outputs({str(tmp_path / "m.prom"): "x 1\n"})
+    assert (tmp_path / "m.prom").exists()
+    assert not (tmp_path / main.OUT_MANIFEST_NAME).exists()
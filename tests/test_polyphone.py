@@ -0,0 +1,27 @@
+import main
+
+
+def test_train_polyphone_model(tmp_path):
+    resolver = main.PinyinResolver(custom_pinyin={}, custom_word_pinyin={})
+    lines = [("自传", ["zi4", "zhuan4"])] * 5 + [
+        ("传说", ["chuan2", "shuo1"]),
+        ("传说", ["chuan2", "shuo1"]),  # 只有两次，不到 min_count
+        ("传记", ["zhuàn", "jì"]),
+        ("abc", ["a", "b", "c"]),          # 不全是汉字
+        ("长发", ["chang"]),               # 字数与拼音数不符
+    ]
+    model, used, skipped = main.train_polyphone_model(lines, resolver, min_count=3, min_conf=0.6)
+    assert (used, skipped) == (8, 2)
+    assert model.contexts == {"传<自": ("zhuan", 0.8571, 5)}  # (5 + 1) / (5 + 传 的 2 个读音)
+    assert model.pick("传", "自", "") == ("zhuan", 0.8571, "传<自")
+    assert model.pick("传", "", "说") is None
+
+    path = tmp_path / "model.json"
+    path.write_text(model.to_json(), encoding="utf-8")
+    assert main.load_polyphone_model(path).contexts == model.contexts
+
+    config = main.BuildConfig(
+        custom_pinyin={}, custom_word_pinyin={}, polyphone_model=str(path), targets=frozenset({"full"})
+    )
+    out = main.build([["词"], ["自传"], ["传说"]], config).files[main.OUT_FULL]
+    assert out == "自传\tzi zhuan\t3000\n传说\tchuan shuo\t3000\n"
@@ -0,0 +1,43 @@
+import pytest
+
+import main
+
+
+def test_diff_sorted_entries():
+    old = main.sorted_entries([
+        ("灵梦", "ling meng", 3000),
+        ("魔理沙", "mo li sha", 3000),
+        ("梦符", "meng fu", 3000),
+        ("魂魄妖梦", "hun po yao meng", 3000),
+    ])
+    new = main.sorted_entries([
+        ("灵梦", "ling meng", 3000),
+        ("魔理沙", "mo li sha", 5000),  # 改权重
+        ("梦符", "meng fu", 3000),
+        ("梦符", "mf", 3000),           # 多了一种编码
+        ("咲夜", "xiao ye", 3000),      # 新增
+        ("咲夜", "xiao ye", 100),       # 重复条目只保留权重高的
+    ])
+    diff = {text: (before, after) for text, before, after in main.diff_sorted_entries(old, new)}
+    assert diff == {
+        "魔理沙": ({"mo li sha": 3000}, {"mo li sha": 5000}),
+        "梦符": ({"meng fu": 3000}, {"meng fu": 3000, "mf": 3000}),
+        "咲夜": ({}, {"xiao ye": 3000}),
+        "魂魄妖梦": ({"hun po yao meng": 3000}, {}),
+    }
+
+
+def test_diff_sorted_entries_rejects_unsorted():
+    with pytest.raises(main.BuildError):
+        list(main.diff_sorted_entries([("b", "b", 1), ("a", "a", 1)], []))
+
+
+def test_release_writes_delta(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "v1.txt").write_text("灵梦\tling meng\t3000\n魔理沙\tmo li sha\t3000\n", encoding="utf-8")
+    (tmp_path / "v2.txt").write_text("灵梦\tling meng\t3000\n咲夜\txiao ye\t3000\n", encoding="utf-8")
+    assert main.main(["release", "--new", "v1.txt", "--version", "1"]) == 0
+    assert main.main(["release", "--new", "v2.txt", "--version", "2"]) == 0
+    assert (tmp_path / main.RELEASE_DELTA_ADD).read_text(encoding="utf-8") == "咲夜\txiao ye\t3000\n"
+    assert (tmp_path / main.RELEASE_DELTA_REMOVE).read_text(encoding="utf-8") == "魔理沙\tmo li sha\t3000\n"
+    assert "- 新增 1 个：咲夜" in capsys.readouterr().out
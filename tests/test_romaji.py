@@ -0,0 +1,14 @@
+import main
+
+
+def test_romaji_prefix_lookup(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / main.INPUT_CSV).write_text("全名,姓,名\n博丽灵梦,博丽,灵梦\n", encoding="utf-8")
+    (tmp_path / main.ROMAJI_CSV).write_text("6,红魔乡,博丽灵梦,博麗靈夢,Hakurei_Reimu\n", encoding="utf-8")
+
+    assert main.main(["--romaji", "--index", "--targets", "full"]) == 0
+    capsys.readouterr()
+    assert main.main(["lookup", "reim"]) == 0
+    out = capsys.readouterr().out.splitlines()
+    assert f"博丽灵梦{main.COL_SEP}reimu{main.COL_SEP}{main.ROMAJI_WEIGHT}" in out
+    assert f"灵梦{main.COL_SEP}reimu{main.COL_SEP}{main.ROMAJI_WEIGHT}" in out
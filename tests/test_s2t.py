@@ -0,0 +1,37 @@
+import main
+
+
+def test_s2t_longest_phrase_match():
+    conv = main.S2TConverter(
+        {"头发": "頭髮", "发展": "發展", "博丽灵梦": "博麗靈夢"},
+        {"发": "發", "头": "頭", "灵": "靈", "梦": "夢", "丽": "麗"},
+    )
+    assert conv.convert("头发") == "頭髮"
+    assert conv.convert("发展") == "發展"
+    assert conv.convert("头发展") == "頭髮展"  # 从左往右最长匹配
+    assert conv.convert("博丽灵梦的梦") == "博麗靈夢的夢"
+    assert conv.convert("博丽灵") == "博麗靈"  # 词组没匹配完，退回单字表
+    assert conv.convert("abc") == "abc"
+
+
+def test_opencc_and_thchars_tables(tmp_path):
+    (tmp_path / "STPhrases.txt").write_text("头发\t頭髮 头髮\n", encoding="utf-8")
+    (tmp_path / "thchars.csv").write_text(
+        "6,红魔乡,博丽灵梦,博麗靈夢,Hakurei_Reimu\n6,红魔乡,冴月麟,冴月麟（さつきりん）,Satsuki_Rin\n",
+        encoding="utf-8",
+    )
+    assert main.load_opencc_table(tmp_path / "STPhrases.txt") == {"头发": "頭髮"}
+    assert main.load_thchars_trad_phrases(tmp_path / "thchars.csv") == {"博丽灵梦": "博麗靈夢"}
+
+
+def test_trad_without_tables(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / main.INPUT_CSV).write_text("人物\n头发\n", encoding="utf-8")
+    assert main.main(["--trad", "--targets", "full"]) == 1
+    assert "--trad" in capsys.readouterr().err
+
+    (tmp_path / "tables").mkdir()
+    (tmp_path / main.S2T_CHAR_TABLE).write_text("头\t頭\n发\t發 髮\n", encoding="utf-8")
+    assert main.main(["--trad", "--targets", "full"]) == 0
+    assert f"找不到 {main.ROMAJI_CSV}" in capsys.readouterr().err
+    assert "頭發\ttou fa" in (tmp_path / main.OUT_FULL).read_text(encoding="utf-8")
@@ -0,0 +1,25 @@
+import main
+
+WUBI = main.SHAPE_RULES["wubi"]
+
+
+def test_char_code_table(tmp_path):
+    path = tmp_path / "wubi86.dict.yaml"
+    path.write_text(
+        "---\nname: wubi86\n...\n# 注释\n东\ta\n东\taii\n方\tyygn\n𠀀\tgkq\n", encoding="utf-8"
+    )
+    table = main.load_char_code_table(path)
+    assert table.get("东") == "aii"  # 多个编码取最长的全码
+    assert table.get("方") == "yygn"
+    assert table.get("𠀀") == "gkq"  # 基本区以外的字
+    assert table.get("灵") is None
+
+
+def test_shape_word_code():
+    table = main.CharCodeTable({"东": "aii", "方": "yygn", "灵": "vou", "梦": "ssq", "神": "pyjh"})
+    assert main.shape_word_code("东", table, WUBI) == "aii"
+    assert main.shape_word_code("东方", table, WUBI) == "aiyy"
+    assert main.shape_word_code("东方灵", table, WUBI) == "ayvo"
+    assert main.shape_word_code("东方灵梦", table, WUBI) == "ayvs"
+    assert main.shape_word_code("东方神灵梦", table, WUBI) == "ayps"
+    assert main.shape_word_code("东方Q", table, WUBI) is None
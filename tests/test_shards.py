@@ -0,0 +1,34 @@
+import shutil
+from dataclasses import replace
+from pathlib import Path
+
+import main
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def dict_body(path: Path) -> set[str]:
+    text = path.read_text(encoding="utf-8")
+    return set(text.split("...\n", 1)[1].splitlines())
+
+
+def test_shards_match_single_build(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    shutil.copy(REPO / main.INPUT_CSV, tmp_path / main.INPUT_CSV)
+    config = main.BuildConfig(extra="")
+    progress = main.Progress()
+    result = main.build_shards(main.INPUT_CSV, config, disabled=set(), jobs=2, progress=progress)
+    result.write()
+
+    single = main.build(main.INPUT_CSV, replace(config, targets=frozenset({"all"})))
+    expected = set(single.files[main.OUT_ALL].splitlines())
+    shard_dir = Path(main.SHARD_DIR)
+    bodies = [dict_body(p) for p in shard_dir.glob(f"{main.SHARD_DICT_NAME}.*.dict.yaml")]
+    assert len(bodies) == len(main.shard_columns(main.read_csv_rows(main.INPUT_CSV)[0]))
+    assert set().union(*bodies) == expected
+    assert [(st.name, st.count) for st in progress.stages][-1] == ("shards", len(bodies))
+
+    # 没有改动时所有分类都跳过，只重写（内容不变的）总词库和状态文件
+    again = main.build_shards(main.INPUT_CSV, config, disabled=set(), jobs=2)
+    assert all("未变化" in line for line in again.summary if ".dict.yaml" in line and "引用" not in line)
+    assert again.write() == []
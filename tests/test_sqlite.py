@@ -0,0 +1,46 @@
+import sqlite3
+
+import main
+
+
+def open_db(tmp_path, data: bytes) -> sqlite3.Connection:
+    path = tmp_path / "thd.sqlite3"
+    path.write_bytes(data)
+    return sqlite3.connect(path)
+
+
+def test_sqlite_bytes_round_trip(tmp_path):
+    rows = [
+        ("博丽灵梦", "bo li ling meng", 3000, "names", "thd.csv", 2, 1),
+        ("梦符「梦想封印」", "meng fu meng xiang feng yin", 3000, "spells", "thd.csv", 3, 60),
+        ("魔理沙", "mo li sha", 100, "extra", None, None, None),
+    ]
+    data, count = main.sqlite_bytes(rows)
+    assert count == 3
+    conn = open_db(tmp_path, data)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == main.SQLITE_SCHEMA_VERSION
+        got = conn.execute("SELECT text, code, weight, category, source, row, col FROM entries ORDER BY id").fetchall()
+        assert got == rows
+        assert conn.execute("SELECT text FROM entries WHERE initials = 'bllm'").fetchall() == [("博丽灵梦",)]
+        fts = "SELECT e.text FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid WHERE entries_fts MATCH ?"
+        assert conn.execute(fts, ('"梦想封"',)).fetchall() == [("梦符「梦想封印」",)]
+        plan = " ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM entries WHERE code = 'mo li sha'"))
+        assert "entries_code" in plan
+    finally:
+        conn.close()
+
+
+def test_sqlite_build_categories(tmp_path):
+    config = main.BuildConfig(sqlite=True, targets=frozenset({"full"}), extra="\n额外词\te wai ci\t1\n")
+    result = main.build([["原作人物名", "符卡名"], ["博丽灵梦", "梦符"]], config, source_name="t.csv")
+    conn = open_db(tmp_path, result.files[main.OUT_SQLITE])
+    try:
+        got = conn.execute("SELECT text, category, source, row, col FROM entries ORDER BY text").fetchall()
+        assert sorted(got) == sorted([
+            ("博丽灵梦", "names", "t.csv", 2, 1),
+            ("梦符", "spells", "t.csv", 2, 2),
+            ("额外词", "extra", None, None, None),
+        ])
+    finally:
+        conn.close()
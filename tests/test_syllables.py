@@ -0,0 +1,31 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("token, legal", [
+    ("zhuang", True), ("lv", True), ("lve", True), ("er", True), ("biang", True), ("ABC", True),
+    ("diang", False), ("zhv", False), ("lu:", False), ("Abc", False), ("", False),
+])
+def test_is_legal_token(token, legal):
+    assert main.is_legal_token(token) is legal
+
+
+def test_all_pypinyin_readings_are_legal():
+    for ch in "灵梦魔理沙咲夜长重行绿略嗯哼":
+        for r in main.pypinyin_char_readings(ch):
+            assert main.is_legal_token(r.normal), (ch, r)
+
+
+def test_check_overrides():
+    problems = main.check_overrides(
+        {"梦": "meng", "灵": "lin g", "沙": "shx"},
+        {"魔理沙": "mo li sha", "博丽": "bo", "雾雨": "wu yv", "魔理沙·雾雨": "mo li sha", "空": ""},
+    )
+    assert problems == [
+        'CUSTOM_PINYIN["灵"] = "lin g"：应当正好一个音节',
+        'CUSTOM_PINYIN["沙"] = "shx"：不合法的音节',
+        'CUSTOM_WORD_PINYIN["博丽"] = "bo"：1 个音节，但文本应有 2 个',
+        'CUSTOM_WORD_PINYIN["雾雨"] = "wu yv"：不合法的音节 yv',
+        'CUSTOM_WORD_PINYIN["魔理沙·雾雨"] = "mo li sha"：人名按 · 拆开后分别查找，带 · 的键用不到',
+    ]
@@ -0,0 +1,21 @@
+import pytest
+
+import main
+
+
+def test_tone_outputs():
+    config = main.BuildConfig(tones=True, targets=frozenset({"full"}))
+    files = main.build([["词"], ["绿茶"], ["东方"]], config).files
+    assert files[main.OUT_TONE3] == "绿茶\tlv4 cha2\t3000\n东方\tdong1 fang1\t3000\n"
+    assert files[main.OUT_TONEMARK] == "绿茶\tlǜ chá\t3000\n东方\tdōng fāng\t3000\n"
+    assert files[main.OUT_ZHUYIN] == "绿茶\tㄌㄩˋ ㄔㄚˊ\t3000\n东方\tㄉㄨㄥ ㄈㄤ\t3000\n"
+
+
+@pytest.mark.parametrize("scheme, codes", [
+    ("xiaohe", ["vl", "lv", "an", "ah", "ee", "er", "ou", "xs"]),
+    ("mspy", ["vd", "ly", "oj", "oh", "oe", "or", "ob", "xs"]),
+])
+def test_shuangpin_code(scheme, codes):
+    syllables = ["zhuang", "lv", "an", "ang", "e", "er", "ou", "xiong"]
+    assert [main.shuangpin_code(main.SHUANGPIN_SCHEMES[scheme], s) for s in syllables] == codes
+    assert main.shuangpin_code(main.SHUANGPIN_SCHEMES[scheme], "ABC") is None
@@ -0,0 +1,24 @@
+import main
+
+
+def test_build_from_read_rows_keeps_source_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "t.csv").write_text("人物,符卡\n灵梦,梦符\n魔理沙,恋符\n", encoding="utf-8")
+    config = main.BuildConfig(targets=frozenset({"full", "simp"}))
+    rows, _ = main.load_rows("t.csv", config)
+    from_path = main.build("t.csv", config)
+    from_rows = main.build(rows, config, source_name="t.csv")
+    assert from_rows.files == from_path.files
+    assert from_rows.sources == from_path.sources == ["t.csv"]
+
+
+def test_watch_memo_drops_edited_cells():
+    config = main.BuildConfig(targets=frozenset({"full"}))
+    memo = main.WatchMemo()
+    main.build([["人物"], ["灵梦"], ["魔理沙"]], config, memo)
+    memo.prune()
+    assert {"灵梦", "魔理沙"} <= set(memo)
+    main.build([["人物"], ["灵梦"], ["咲夜"]], config, memo)
+    memo.prune()
+    assert "魔理沙" not in memo
+    assert {"灵梦", "咲夜"} <= set(memo)
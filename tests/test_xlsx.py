@@ -0,0 +1,25 @@
+import pytest
+
+import main
+
+
+def save_workbook(path, cards):
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    wb.active.append(["符卡名"])
+    for card in cards:
+        wb.active.append([card])
+    path.parent.mkdir(exist_ok=True)
+    wb.save(path)
+
+
+def test_xlsx_cache_keeps_newest_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache_dir = tmp_path / main.XLSX_CACHE_DIR
+    for cards in (["恋符"], ["恋符", "魔符"], ["星符"]):
+        save_workbook(tmp_path / "w.xlsx", cards)
+        assert [r[0] for r in main.read_xlsx_rows("w.xlsx")[1:]] == cards
+        assert len(list(cache_dir.glob("w.*.json"))) == 1
+    save_workbook(tmp_path / "other" / "w.xlsx", ["恋符"])
+    main.read_xlsx_rows("other/w.xlsx")  # 同名但不在同一路径的工作簿各留一份
+    assert len(list(cache_dir.glob("w.*.json"))) == 2